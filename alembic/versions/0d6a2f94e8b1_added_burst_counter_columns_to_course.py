@@ -0,0 +1,29 @@
+"""added burst counter columns to course
+
+Revision ID: 0d6a2f94e8b1
+Revises: c5d83f0e6b17
+Create Date: 2026-10-16 13:40:05.127733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d6a2f94e8b1'
+down_revision = 'c5d83f0e6b17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('courses', sa.Column('last_burst_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('courses', sa.Column('total_duration', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('courses', sa.Column('current_week_duration', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    # Fill the counters afterwards with: python -m app.backfill courses
+
+
+def downgrade() -> None:
+    op.drop_column('courses', 'current_week_duration')
+    op.drop_column('courses', 'total_duration')
+    op.drop_column('courses', 'last_burst_at')
@@ -0,0 +1,48 @@
+"""added foreign key and time indexes
+
+Revision ID: 3f1c9b7a52d4
+Revises: e9c57613d88b
+Create Date: 2026-10-16 09:12:40.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9b7a52d4'
+down_revision = 'e9c57613d88b'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns), matched to the router access patterns
+indexes = [
+    ('ix_courses_user_id', 'courses', ['user_id']),
+    ('ix_lessons_course_id', 'lessons', ['course_id']),
+    ('ix_lessons_user_id', 'lessons', ['user_id']),
+    ('ix_topics_lesson_id_completed', 'topics', ['lesson_id', 'completed']),
+    ('ix_topics_course_id_completed', 'topics', ['course_id', 'completed']),
+    ('ix_topics_user_id', 'topics', ['user_id']),
+    ('ix_bursts_course_id_creation_date', 'bursts', ['course_id', 'creation_date']),
+    ('ix_bursts_user_id_creation_date', 'bursts', ['user_id', 'creation_date']),
+    ('ix_bursts_lesson_id', 'bursts', ['lesson_id']),
+    ('ix_invites_invite_code', 'invites', ['invite_code']),
+    ('ix_invites_event_id', 'invites', ['event_id']),
+    ('ix_invites_email', 'invites', ['email']),
+]
+
+
+def upgrade() -> None:
+    # Build concurrently so large tables stay writable during the migration
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(indexes):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
@@ -0,0 +1,40 @@
+"""added burst daily rollup table
+
+Revision ID: 4a9f0c3e7d12
+Revises: 8e41c7d2b5a0
+Create Date: 2026-10-16 15:48:12.604917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a9f0c3e7d12'
+down_revision = '8e41c7d2b5a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('burst_daily',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.Column('total_duration', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('burst_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('interrupted_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('self_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('digital_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('people_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'course_id')
+    )
+    op.create_index('ix_burst_daily_course_id_day', 'burst_daily', ['course_id', 'day'], unique=False)
+    # Fill the rollup afterwards with: python -m app.backfill burst_daily
+
+
+def downgrade() -> None:
+    op.drop_index('ix_burst_daily_course_id_day', table_name='burst_daily')
+    op.drop_table('burst_daily')
@@ -0,0 +1,39 @@
+"""added email outbox table
+
+Revision ID: 7b2e4d1a9c63
+Revises: 3f1c9b7a52d4
+Create Date: 2026-10-16 11:02:17.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2e4d1a9c63'
+down_revision = '3f1c9b7a52d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('subject', sa.String(), nullable=False),
+    sa.Column('recipients', sa.JSON(), nullable=False),
+    sa.Column('template_name', sa.String(), nullable=False),
+    sa.Column('template_body', sa.JSON(), nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('next_attempt_date', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('sent_date', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('creation_date', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_pending', 'outbox', ['next_attempt_date'], unique=False,
+                    postgresql_where=sa.text('sent_date IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_pending', table_name='outbox')
+    op.drop_table('outbox')
@@ -0,0 +1,30 @@
+"""added due topics partial index
+
+Revision ID: 8e41c7d2b5a0
+Revises: 0d6a2f94e8b1
+Create Date: 2026-10-16 15:02:47.519384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e41c7d2b5a0'
+down_revision = '0d6a2f94e8b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Build concurrently so topics stay writable during the migration
+    with op.get_context().autocommit_block():
+        op.create_index('ix_topics_due', 'topics', ['user_id', 'revision_date'], unique=False,
+                        postgresql_where=sa.text('completed AND NOT revised'),
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_topics_due', table_name='topics',
+                      postgresql_concurrently=True)
@@ -0,0 +1,53 @@
+"""added updated_at columns and tombstones
+
+Revision ID: b73e5f28c9d4
+Revises: 4a9f0c3e7d12
+Create Date: 2026-10-16 16:35:21.083642
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b73e5f28c9d4'
+down_revision = '4a9f0c3e7d12'
+branch_labels = None
+depends_on = None
+
+
+tables = ['courses', 'lessons', 'topics', 'bursts']
+
+
+def upgrade() -> None:
+    for table in tables:
+        op.add_column(table, sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_user_id_deleted_at', 'tombstones', ['user_id', 'deleted_at'], unique=False)
+
+    # Build concurrently so large tables stay writable during the migration
+    with op.get_context().autocommit_block():
+        for table in tables:
+            op.create_index(f'ix_{table}_user_id_updated_at', table, ['user_id', 'updated_at'], unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in reversed(tables):
+            op.drop_index(f'ix_{table}_user_id_updated_at', table_name=table,
+                          postgresql_concurrently=True)
+
+    op.drop_index('ix_tombstones_user_id_deleted_at', table_name='tombstones')
+    op.drop_table('tombstones')
+    for table in reversed(tables):
+        op.drop_column(table, 'updated_at')
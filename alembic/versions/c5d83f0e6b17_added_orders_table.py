@@ -0,0 +1,33 @@
+"""added orders table
+
+Revision ID: c5d83f0e6b17
+Revises: 7b2e4d1a9c63
+Create Date: 2026-10-16 12:21:48.906154
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d83f0e6b17'
+down_revision = '7b2e4d1a9c63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('orders',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('currency', sa.String(), nullable=False),
+    sa.Column('renewal', sa.Boolean(), nullable=True),
+    sa.Column('status', sa.String(), server_default='created', nullable=False),
+    sa.Column('payment_id', sa.String(), nullable=True),
+    sa.Column('creation_date', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('orders')
@@ -0,0 +1,33 @@
+"""added burst idempotency key
+
+Revision ID: e2c6a9d41f87
+Revises: b73e5f28c9d4
+Create Date: 2026-10-16 17:12:56.471309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c6a9d41f87'
+down_revision = 'b73e5f28c9d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('bursts', sa.Column('idempotency_key', sa.String(), nullable=True))
+
+    # Build concurrently so bursts stay writable during the migration
+    with op.get_context().autocommit_block():
+        op.create_index('ix_bursts_user_id_idempotency_key', 'bursts', ['user_id', 'idempotency_key'], unique=True,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_bursts_user_id_idempotency_key', table_name='bursts',
+                      postgresql_concurrently=True)
+
+    op.drop_column('bursts', 'idempotency_key')
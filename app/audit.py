@@ -0,0 +1,150 @@
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Query
+
+from . import metrics, models, schemas
+from .database import SessionLocal, engine
+from .routers import burst, sync, topic, user
+
+
+# Run EXPLAIN against the queries the routers issue and flag sequential
+# scans on large tables. Usage: python -m app.audit [--min-rows N]
+# Queries built inline in a route are repeated here, the others come from
+# the same functions the routes call.
+
+
+def router_queries(db, sample_id: int):
+    now = datetime.now().astimezone()
+    week_ago = now - timedelta(weeks=1)
+
+    return {
+        "courses by user": db.query(models.Course).filter(
+            models.Course.user_id == sample_id),
+        "lessons by course": db.query(models.Lesson).filter(
+            models.Lesson.course_id == sample_id),
+        "lessons by user": db.query(models.Lesson).filter(
+            models.Lesson.user_id == sample_id),
+        "topics by lesson": db.query(models.Topic).filter(
+            models.Topic.lesson_id == sample_id),
+        "topics by course": db.query(models.Topic).filter(
+            models.Topic.course_id == sample_id),
+        "topics by user": db.query(models.Topic).filter(
+            models.Topic.user_id == sample_id),
+        "due topics by user": db.query(models.Topic).filter(
+            models.Topic.user_id == sample_id,
+            models.Topic.completed == True,
+            models.Topic.revised == False,
+            models.Topic.revision_date < now).order_by(models.Topic.revision_date, models.Topic.id),
+        "bursts by course": db.query(models.Burst).filter(
+            models.Burst.course_id == sample_id),
+        "bursts by user": db.query(models.Burst).filter(
+            models.Burst.user_id == sample_id),
+        "burst goal window": db.query(models.Burst.course_id, func.sum(models.Burst.duration)).filter(
+            models.Burst.course_id == sample_id,
+            models.Burst.creation_date > week_ago,
+            models.Burst.creation_date < now).group_by(models.Burst.course_id),
+        "user by username": db.query(models.User).filter(
+            models.User.username == "audit"),
+        "user by email": db.query(models.User).filter(
+            models.User.email == "audit@example.com"),
+        "invite by code": db.query(models.Invite).filter(
+            models.Invite.invite_code == "audit"),
+        "invite by event": db.query(models.Invite).filter(
+            models.Invite.event_id == "audit"),
+        "invite by email": db.query(models.Invite).filter(
+            models.Invite.email == "audit@example.com"),
+        "workspace courses": db.query(models.Course).filter(
+            models.Course.user_id == sample_id).order_by(models.Course.id),
+        "workspace lessons": db.query(models.Lesson).filter(
+            models.Lesson.user_id == sample_id).order_by(models.Lesson.id),
+        "workspace topics": db.query(models.Topic).filter(
+            models.Topic.user_id == sample_id).order_by(models.Topic.id),
+        **{f"sync {name} changed": sync.changed_rows(db, model, schema, sample_id, week_ago)
+           for name, (model, schema) in sync.synced_tables.items()},
+        "sync tombstones": sync.deleted_rows(db, sample_id, week_ago),
+        "burst heatmap": burst.heatmap_days(db, sample_id, 365, None),
+        "burst heatmap by course": burst.heatmap_days(db, sample_id, 365, sample_id),
+        "topic bulk update": topic.bulk_update(
+            [(sample_id, "audit", None, True, False, 1, now, 1)]),
+        **{f"sudo {model.__tablename__} page": user.listing_statement(
+            select(model).where(model.user_id == sample_id), model, schema, week_ago, sample_id)
+           for model, schema in ((models.Course, schemas.CourseGet), (models.Lesson, schemas.LessonGet),
+                                 (models.Topic, schemas.TopicGet), (models.Burst, schemas.BurstGet))},
+        "sudo users page": user.listing_statement(
+            select(models.User).where(models.User.active == True), models.User, schemas.UserGet, week_ago, sample_id),
+        "burst batch insert": metrics.insert_bursts_statement([{
+            "course_id": sample_id, "lesson_id": sample_id, "user_id": sample_id, "duration": 60,
+            "interrupted": False, "interruption": None, "idempotency_key": "audit", "creation_date": now}]),
+        "burst batch counters": metrics.bursts_to_counters([sample_id]),
+        "burst batch daily": metrics.bursts_to_daily([sample_id]),
+    }
+
+
+# Takes ORM queries and Core statements, IN lists are rendered in place
+def explain(connection, query):
+    statement = query.statement if isinstance(query, Query) else query
+    compiled = statement.compile(dialect=connection.dialect,
+                                 compile_kwargs={"render_postcompile": True})
+    result = connection.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def sequential_scans(plan):
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from sequential_scans(child)
+
+
+def table_sizes(connection):
+    rows = connection.exec_driver_sql(
+        "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'")
+    return {name: int(tuples) for name, tuples in rows}
+
+
+def audit(min_rows: int, sample_id: int):
+    db = SessionLocal()
+    flagged = []
+    try:
+        with engine.connect() as connection:
+            sizes = table_sizes(connection)
+            for name, query in router_queries(db, sample_id).items():
+                scanned = list(sequential_scans(explain(connection, query)))
+                if len(scanned) == 0:
+                    print(f"{name}: ok")
+                for table in scanned:
+                    rows = sizes.get(table, 0)
+                    status = "SEQ SCAN" if rows >= min_rows else "ok (small)"
+                    print(f"{name}: {status} on {table} (~{rows} rows)")
+                    if rows >= min_rows:
+                        flagged.append((name, table, rows))
+    finally:
+        db.close()
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Flag sequential scans in the queries issued by the routers.")
+    parser.add_argument("--min-rows", type=int, default=10000,
+                        help="Only flag tables with at least this many estimated rows.")
+    parser.add_argument("--sample-id", type=int, default=1,
+                        help="Id used for user/course/lesson filters.")
+    args = parser.parse_args()
+
+    flagged = audit(args.min_rows, args.sample_id)
+    if flagged:
+        print(f"{len(flagged)} sequential scan(s) on large tables.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import time
+from datetime import datetime
+
+from . import metrics, models
+from .database import SessionLocal
+
+
+# Rebuild derived tables and counters from the raw rows.
+# Usage: python -m app.backfill {courses,burst_daily,rollover} [--batch-size N]
+
+
+def backfill_courses(batch_size: int):
+    db = SessionLocal()
+    try:
+        last_id = db.query(models.Course.id).order_by(
+            models.Course.id.desc()).limit(1).scalar() or 0
+
+        # One committed UPDATE per id range keeps locks and WAL bursts short.
+        # Goal windows are rolled first so the week count covers this week.
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            in_batch = (models.Course.id >= start,
+                        models.Course.id < start + batch_size)
+            metrics.roll_goal_windows(
+                db, datetime.now().astimezone(), *in_batch)
+            updated += metrics.refresh_course_counters(db, *in_batch)
+            db.commit()
+        return updated
+    finally:
+        db.close()
+
+
+def backfill_burst_daily(batch_size: int):
+    db = SessionLocal()
+    try:
+        last_id = db.query(models.User.id).order_by(
+            models.User.id.desc()).limit(1).scalar() or 0
+
+        # Each user id range is deleted and rebuilt in one transaction
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            updated += metrics.rebuild_burst_daily(
+                db, start, start + batch_size)
+            db.commit()
+        return updated
+    finally:
+        db.close()
+
+
+# Apply the time-based state changes the GET routes no longer write: goal
+# window rollover, lapsed streaks and expired memberships. Meant to run from
+# cron next to python -m app.decay, every step is idempotent.
+def backfill_rollover(batch_size: int):
+    db = SessionLocal()
+    try:
+        last_id = db.query(models.Course.id).order_by(
+            models.Course.id.desc()).limit(1).scalar() or 0
+
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            now = datetime.now().astimezone()
+            updated += metrics.roll_goal_windows(
+                db, now, models.Course.id >= start, models.Course.id < start + batch_size)
+            updated += metrics.reset_lapsed_streaks(
+                db, now, models.Course.id >= start, models.Course.id < start + batch_size)
+            db.commit()
+
+        updated += len(metrics.deactivate_expired_users(
+            db, datetime.now().astimezone()))
+        db.commit()
+        return updated
+    finally:
+        db.close()
+
+
+targets = {
+    "courses": backfill_courses,
+    "burst_daily": backfill_burst_daily,
+    "rollover": backfill_rollover,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Backfill derived data from the raw rows.")
+    parser.add_argument("target", choices=list(targets))
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="Number of ids processed per transaction.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    updated = targets[args.target](args.batch_size)
+    print(f"{args.target}: {updated} rows updated in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,31 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    database_async: bool = False
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: int = 30
+    database_pool_recycle: int = -1
+    database_pool_pre_ping: bool = False
+    database_pgbouncer: bool = False
+    database_replica_urls: str = ""
+    database_replica_check_interval: int = 10
+    database_replica_max_lag: int = 30
+    database_replica_connect_timeout: int = 5
+    user_cache_ttl: int = 60
+    user_cache_size: int = 10000
+    hashing_workers: int = 2
+    hashing_queue_limit: int = 64
+    slow_request_ms: int = 1000
+    burst_batch_size: int = 500
+    topic_batch_size: int = 500
+    burst_write_behind: bool = False
+    burst_flush_interval: int = 200
+    burst_flush_rows: int = 500
+    burst_flush_max_attempts: int = 5
+    burst_queue_size: int = 10000
+    burst_spool_dir: str = "spool"
+    burst_spool_fsync: bool = True
 
     class Config:
         env_file = ".env"
@@ -30,6 +55,13 @@ class MailSettings(BaseSettings):
     mail_ssl: bool
     use_credentials: bool
     validate_certs: bool
+    outbox_worker: bool = True
+    outbox_batch_size: int = 20
+    outbox_poll_interval: int = 5
+    outbox_max_attempts: int = 8
+    outbox_backoff: int = 30
+    outbox_smtp_timeout: int = 30
+    outbox_batch_timeout: int = 120
 
     class Config:
         env_file = ".env"
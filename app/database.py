@@ -1,23 +1,284 @@
-from sqlalchemy import create_engine
+import asyncio
+import contextvars
+import itertools
+import os
+import time
+from functools import wraps
+
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from starlette.concurrency import run_in_threadpool
 
 from .config import settings
+from .instrumentation import instrument_engine
+from .pool import TimedAsyncQueuePool, TimedQueuePool
 
 
 DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
 
-engine = create_engine(DATABASE_URL)
+
+def pool_options():
+    return {
+        "pool_size": settings.database_pool_size,
+        "max_overflow": settings.database_max_overflow,
+        "pool_timeout": settings.database_pool_timeout,
+        "pool_recycle": settings.database_pool_recycle,
+        "pool_pre_ping": settings.database_pool_pre_ping,
+    }
+
+
+def async_pool_options():
+    options = pool_options()
+
+    # PgBouncer in transaction mode cannot keep server-side prepared statements
+    if settings.database_pgbouncer:
+        options["connect_args"] = {"statement_cache_size": 0}
+    return options
+
+
+def async_url(url: str):
+    url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if settings.database_pgbouncer:
+        url += "?prepared_statement_cache_size=0"
+    return url
+
+
+engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool, **pool_options())
+instrument_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Opt-in asyncpg engine, routes then wait on Postgres without a threadpool slot
+async_engine = None
+AsyncSessionLocal = None
+if settings.database_async:
+    async_engine = create_async_engine(
+        async_url(DATABASE_URL), poolclass=TimedAsyncQueuePool, **async_pool_options())
+    instrument_engine(async_engine.sync_engine)
+    AsyncSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine, class_=AsyncSession)
+
+
+# Engine options for a replica, with the connect timeout under the name the
+# driver takes: connect_timeout for psycopg2, timeout for asyncpg
+def replica_options(options: dict, timeout_argument: str):
+    connect_args = dict(options.get("connect_args", {}))
+    connect_args[timeout_argument] = settings.database_replica_connect_timeout
+    return {**options, "connect_args": connect_args}
+
+
+# Read replica with its own engines and a cached health check. A replica is
+# healthy if it answers and, when a max lag is set, replays recently enough.
+class Replica:
+    lag_query = text(
+        "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)")
+
+    def __init__(self, url: str):
+        # A replica that does not answer is skipped quickly for the primary
+        self.engine = create_engine(url, **replica_options(
+            pool_options(), "connect_timeout"))
+        instrument_engine(self.engine)
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine)
+
+        self.async_engine = None
+        self.AsyncSessionLocal = None
+        if settings.database_async:
+            self.async_engine = create_async_engine(
+                async_url(url), **replica_options(async_pool_options(), "timeout"))
+            instrument_engine(self.async_engine.sync_engine)
+            self.AsyncSessionLocal = sessionmaker(
+                autocommit=False, autoflush=False, expire_on_commit=False, bind=self.async_engine, class_=AsyncSession)
+
+        self.healthy = True
+        self.lag = None
+        self.checked_at = 0.0
+
+    def check_due(self):
+        return time.monotonic() - self.checked_at >= settings.database_replica_check_interval
+
+    def record(self, lag):
+        self.checked_at = time.monotonic()
+        self.lag = lag
+        self.healthy = lag != None and (
+            settings.database_replica_max_lag == 0 or lag <= settings.database_replica_max_lag)
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                lag = connection.execute(self.lag_query).scalar()
+        except exc.DBAPIError:
+            lag = None
+        self.record(lag)
+
+    async def check_async(self):
+        try:
+            async with self.async_engine.connect() as connection:
+                lag = (await connection.execute(self.lag_query)).scalar()
+        except (exc.DBAPIError, OSError, asyncio.TimeoutError):
+            lag = None
+        self.record(lag)
+
+    def stats(self):
+        engine = self.async_engine.sync_engine if self.async_engine != None else self.engine
+        return {
+            "host": engine.url.host,
+            "healthy": self.healthy,
+            "lag": self.lag,
+            "checked_out": engine.pool.checkedout(),
+        }
+
+
+replicas = [Replica(url.strip())
+            for url in settings.database_replica_urls.split(",") if url.strip() != ""]
+replica_counter = itertools.count()
+
+
+# Replicas in round-robin order, the ones after the first act as fallbacks
+def replica_order():
+    if len(replicas) == 0:
+        return []
+    start = next(replica_counter)
+    return [replicas[(start + offset) % len(replicas)] for offset in range(len(replicas))]
+
+
 Base = declarative_base()
 
 
-# Database connection dependency
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_db = get_async_db if settings.database_async else get_sync_db
+
+read_only = text("SET TRANSACTION READ ONLY")
+
+
+def execute_read_only(db):
+    db.execute(read_only)
+
+
+def set_read_only(session, transaction, connection):
+    connection.execute(read_only)
+
+
+# Make every transaction of a session read-only as it begins. The session
+# takes no connection until the route's first statement, by then the
+# authentication lookup has given its own back to the same pool.
+def read_only_on_begin(db):
+    session = db.sync_session if isinstance(db, AsyncSession) else db
+    event.listen(session, "after_begin", set_read_only)
+    return db
+
+
+# Sessions for GET routes. The transaction is read-only, derived values are
+# computed into the response and never flushed back. Served by a healthy
+# replica when one is configured, by the primary otherwise. A replica is
+# tried right away so a failing one falls back to the primary.
+def sync_read_session():
+    for replica in replica_order():
+        if replica.check_due():
+            replica.check()
+        if not replica.healthy:
+            continue
+        db = replica.SessionLocal()
+        try:
+            db.execute(read_only)
+            return db
+        except exc.DBAPIError:
+            db.close()
+            replica.record(None)
+
+    return read_only_on_begin(SessionLocal())
+
+
+async def async_read_session():
+    for replica in replica_order():
+        if replica.check_due():
+            await replica.check_async()
+        if not replica.healthy:
+            continue
+        db = replica.AsyncSessionLocal()
+        try:
+            await run_sync(db, execute_read_only)
+            return db
+        except (exc.DBAPIError, OSError, asyncio.TimeoutError):
+            await db.close()
+            replica.record(None)
+
+    return read_only_on_begin(AsyncSessionLocal())
+
+
+def get_sync_read_db():
+    db = sync_read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    db = await async_read_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+get_read_db = get_async_read_db if settings.database_async else get_sync_read_db
+
+
+# Pool telemetry of the engines in this worker process
+def pool_stats():
+    stats = {"pid": os.getpid(), "sync": TimedQueuePool.stats.snapshot(engine.pool)}
+    if async_engine != None:
+        stats["async"] = TimedAsyncQueuePool.stats.snapshot(
+            async_engine.sync_engine.pool)
+    if len(replicas) > 0:
+        stats["replicas"] = [replica.stats() for replica in replicas]
+    return stats
+
+
+# Run fn(session, ...) against either kind of session without blocking the
+# event loop: AsyncSession.run_sync in async mode, the threadpool otherwise.
+# The caller's context variables (request instrumentation) travel along.
+async def run_sync(db, fn, *args, **kwargs):
+    context = contextvars.copy_context()
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(lambda session: context.run(fn, session, *args, **kwargs))
+    return await run_in_threadpool(context.run, fn, db, *args, **kwargs)
+
+
+# Iterate the rows of a select in batches of batch_size without loading
+# them all, as an async iterator for either kind of session. Goes through
+# run_sync like every other statement, so the request instrumentation sees it.
+async def stream_rows(db, statement, batch_size: int = 1000):
+    statement = statement.execution_options(
+        stream_results=True, yield_per=batch_size)
+    result = await run_sync(db, lambda session: session.execute(statement))
+    while True:
+        rows = await run_sync(db, lambda session: result.fetchmany(batch_size))
+        if len(rows) == 0:
+            break
+        for row in rows:
+            yield row
+
+
+# Turn a route written against a sync Session into an async route
+def session_route(route):
+    @wraps(route)
+    async def wrapper(**kwargs):
+        db = kwargs.pop("db")
+        return await run_sync(db, lambda session: route(db=session, **kwargs))
+    return wrapper
@@ -0,0 +1,66 @@
+import argparse
+import time
+from datetime import datetime
+
+from . import metrics, models
+from .database import SessionLocal
+
+
+# Apply topic stability decay and revision rescheduling to every topic in
+# chunked UPDATEs. Safe to rerun: updated topics are no longer due or
+# overdue. Usage: python -m app.decay [--batch-size N] [--dry-run]
+
+
+def decay_topics(batch_size: int, dry_run: bool):
+    db = SessionLocal()
+    try:
+        now = datetime.now().astimezone()
+        last_id = db.query(models.Topic.id).order_by(
+            models.Topic.id.desc()).limit(1).scalar() or 0
+
+        counts = {"updated": 0, "due": 0, "overdue": 0}
+        for start in range(0, last_id + 1, batch_size):
+            in_batch = (models.Topic.id >= start,
+                        models.Topic.id < start + batch_size)
+
+            if dry_run:
+                total, due, overdue = metrics.count_topic_revisions(
+                    db, now, *in_batch)
+                counts["updated"] += total
+                counts["due"] += due
+                counts["overdue"] += overdue
+                continue
+
+            # One committed UPDATE per id range keeps row locks short
+            counts["updated"] += metrics.update_topic_revisions(
+                db, now, *in_batch)
+            db.commit()
+
+        return counts
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decay overdue topics and reschedule their revisions.")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="Number of topic ids processed per transaction.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only count the topics that would change.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = decay_topics(args.batch_size, args.dry_run)
+    elapsed = time.perf_counter() - start
+    rate = counts["updated"] / elapsed if elapsed > 0 else 0
+
+    if args.dry_run:
+        print(f"dry run: {counts['updated']} topics would change "
+              f"({counts['due']} due, {counts['overdue']} overdue), counted in {elapsed:.1f}s")
+    else:
+        print(f"decay: {counts['updated']} topics updated in {elapsed:.1f}s ({rate:.0f} topics/s)")
+
+
+if __name__ == "__main__":
+    main()
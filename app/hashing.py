@@ -0,0 +1,51 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+
+from . import utils
+from .config import settings
+
+
+# bcrypt runs in a dedicated process pool so hashing never holds the GIL of
+# the worker serving requests. Created lazily, once per gunicorn worker.
+executor = None
+pending = 0
+
+
+def get_executor():
+    global executor
+    if executor == None:
+        executor = ProcessPoolExecutor(max_workers=settings.hashing_workers)
+    return executor
+
+
+async def run(fn, *args):
+    global pending
+
+    # Fail fast instead of piling up behind a login storm
+    if pending >= settings.hashing_queue_limit:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Server is busy. Please try again shortly.", headers={"Retry-After": "1"})
+
+    pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), fn, *args)
+    finally:
+        pending -= 1
+
+
+async def hash(password: str):
+    return await run(utils.hash, password)
+
+
+async def verify(plain, hashed):
+    return await run(utils.verify, plain, hashed)
+
+
+def shutdown():
+    global executor
+    if executor != None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
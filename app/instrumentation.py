@@ -0,0 +1,124 @@
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from .config import settings
+
+
+# Per-request SQL count, DB time and external call timings, reported in a
+# Server-Timing header and one structured log line per request
+
+logger = logging.getLogger("app.requests")
+
+max_statements = 100
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = []
+        self.timings = {}
+
+    def add_statement(self, statement: str, duration: float):
+        self.sql_count += 1
+        self.sql_time += duration
+        if len(self.statements) < max_statements:
+            self.statements.append(
+                {"sql": " ".join(statement.split()), "ms": round(duration * 1000, 3)})
+
+    def add_timing(self, name: str, duration: float):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def server_timing(self, total: float):
+        metrics = [f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"']
+        for name, duration in self.timings.items():
+            metrics.append(f"{name};dur={duration * 1000:.1f}")
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+current_stats: ContextVar = ContextVar("current_stats", default=None)
+
+
+# Time an external call (Razorpay, mail, ...) against the current request
+@contextmanager
+def timed(name: str):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats.get()
+        if stats != None:
+            stats.add_timing(name, perf_counter() - start)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start"].pop()
+    stats = current_stats.get()
+    if stats != None:
+        stats.add_statement(statement, perf_counter() - start)
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing",
+                               stats.server_timing(perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            log_request(scope, status_code, stats, perf_counter() - start)
+
+
+def log_request(scope, status_code: int, stats: RequestStats, duration: float):
+    record = {
+        "method": scope["method"],
+        "path": scope["path"],
+        "status": status_code,
+        "ms": round(duration * 1000, 3),
+        "sql_count": stats.sql_count,
+        "sql_ms": round(stats.sql_time * 1000, 3),
+    }
+    for name, timing in stats.timings.items():
+        record[f"{name}_ms"] = round(timing * 1000, 3)
+
+    # Slow requests carry their statement list so N+1 patterns stand out
+    if duration * 1000 >= settings.slow_request_ms:
+        record["statements"] = stats.statements
+        logger.warning(json.dumps(record))
+    else:
+        logger.info(json.dumps(record))
@@ -1,11 +1,17 @@
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
-from .routers import user, auth, course, lesson, topic, burst
+from . import hashing, outbox, writebehind
+from .instrumentation import InstrumentationMiddleware
+from .config import mail, settings
+from .routers import user, auth, course, lesson, topic, burst, internal, workspace, sync
 
 
-# Initiating FastAPI instance
-app = FastAPI()
+# Initiating FastAPI instance, responses are encoded with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 # Setting CORS middleware
@@ -22,8 +28,10 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"]
 )
+app.add_middleware(InstrumentationMiddleware)
 
 
 # Including routers
@@ -33,6 +41,32 @@ app.include_router(course.router)
 app.include_router(lesson.router)
 app.include_router(topic.router)
 app.include_router(burst.router)
+app.include_router(internal.router)
+app.include_router(workspace.router)
+app.include_router(sync.router)
+
+
+outbox_worker = None
+burst_worker = None
+
+
+@app.on_event("startup")
+async def startup():
+    global outbox_worker, burst_worker
+    if mail.outbox_worker:
+        outbox_worker = asyncio.create_task(outbox.run_worker())
+    if settings.burst_write_behind:
+        await run_in_threadpool(writebehind.start)
+        burst_worker = asyncio.create_task(writebehind.run_worker())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    hashing.shutdown()
+    if outbox_worker != None:
+        outbox_worker.cancel()
+    if burst_worker != None:
+        await writebehind.stop(burst_worker)
 
 
 @app.get("/")
@@ -0,0 +1,412 @@
+from datetime import date, datetime, time, timedelta
+from typing import List
+
+from sqlalchemy import Date, Float, String, and_, case, cast, delete, func, insert, literal, literal_column, or_, select, union_all, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.sqltypes import TIMESTAMP
+
+from . import models
+
+
+# Set-based counterparts of the per-object calculations in utils. Every
+# expression mirrors the arithmetic of its utils twin so results match.
+
+day_in_seconds = 86400
+week_in_seconds = 604800
+
+
+def epoch(column):
+    return cast(func.extract("epoch", column), Float)
+
+
+# First goal reset date after the given epoch, stepping a week at a time
+def rolled_goal_reset_date(goal_reset_date, at_epoch):
+    weeks_elapsed = func.floor(
+        (at_epoch - epoch(goal_reset_date)) / week_in_seconds, type_=Float) + 1
+    return func.to_timestamp(
+        epoch(goal_reset_date) + (weeks_elapsed * week_in_seconds),
+        type_=TIMESTAMP(timezone=True))
+
+
+# Move stale goal windows to the week containing now and restart their count
+def roll_goal_windows(db: Session, now: datetime, *criteria):
+    courses = models.Course.__table__
+    statement = update(courses).where(
+        courses.c.goal_reset_date < now,
+        *criteria
+    ).values(
+        goal_reset_date=rolled_goal_reset_date(
+            courses.c.goal_reset_date, now.timestamp()),
+        current_week_duration=0,
+        goal_status=0
+    )
+
+    return db.execute(statement).rowcount
+
+
+# Reset the streak of courses without a burst in the last day
+def reset_lapsed_streaks(db: Session, now: datetime, *criteria):
+    courses = models.Course.__table__
+    statement = update(courses).where(
+        courses.c.streak != 0,
+        courses.c.last_burst_at < now - timedelta(seconds=day_in_seconds),
+        *criteria
+    ).values(streak=0)
+
+    return db.execute(statement).rowcount
+
+
+# Insert a burst and fold it into its course counters (streak, last burst,
+# total and current week duration) in one statement
+def insert_burst(db: Session, values: dict):
+    courses = models.Course.__table__
+    today = datetime.combine(date.today(), time.min).astimezone()
+
+    new_burst = insert(models.Burst.__table__).values(
+        **values).returning(*models.Burst.__table__.c).cte("new_burst")
+
+    in_goal_window = new_burst.c.creation_date < courses.c.goal_reset_date
+    streak_lapsed = epoch(new_burst.c.creation_date) - \
+        epoch(courses.c.last_burst_at) > day_in_seconds
+
+    statement = update(courses).where(
+        courses.c.id == new_burst.c.course_id
+    ).values(
+        streak=case(
+            (courses.c.last_burst_at == None, courses.c.streak + 1),
+            (streak_lapsed, 1),
+            (courses.c.last_burst_at < today, courses.c.streak + 1),
+            else_=courses.c.streak),
+        last_burst_at=func.greatest(
+            courses.c.last_burst_at, new_burst.c.creation_date),
+        total_duration=courses.c.total_duration + new_burst.c.duration,
+        current_week_duration=case(
+            (in_goal_window, courses.c.current_week_duration + new_burst.c.duration),
+            else_=new_burst.c.duration),
+        goal_reset_date=case(
+            (in_goal_window, courses.c.goal_reset_date),
+            else_=rolled_goal_reset_date(courses.c.goal_reset_date, epoch(new_burst.c.creation_date)))
+    ).returning(*new_burst.c)
+
+    new_burst = dict(db.execute(statement).mappings().first())
+    add_burst_to_daily(db, new_burst)
+
+    return new_burst
+
+
+daily_counters = ("total_duration", "burst_count", "interrupted_count",
+                  "self_count", "digital_count", "people_count")
+
+
+# Count a new burst into its burst_daily row, days follow the database time zone
+def add_burst_to_daily(db: Session, burst: dict):
+    daily = models.BurstDaily.__table__
+    interrupted = burst["interrupted"] == True
+    statement = postgresql.insert(daily).values(
+        user_id=burst["user_id"],
+        day=cast(literal(burst["creation_date"],
+                 TIMESTAMP(timezone=True)), Date),
+        course_id=burst["course_id"],
+        total_duration=burst["duration"] or 0,
+        burst_count=1,
+        interrupted_count=int(interrupted),
+        self_count=int(interrupted and burst["interruption"] == "Self"),
+        digital_count=int(interrupted and burst["interruption"] == "Digital"),
+        people_count=int(interrupted and burst["interruption"] == "People"))
+    statement = statement.on_conflict_do_update(
+        index_elements=[daily.c.user_id, daily.c.day, daily.c.course_id],
+        set_={name: daily.c[name] + statement.excluded[name] for name in daily_counters})
+
+    db.execute(statement)
+
+
+# burst_daily rows of the bursts matching the criteria, summed from bursts
+def daily_totals(*criteria):
+    bursts = models.Burst.__table__
+    day = cast(bursts.c.creation_date, Date)
+    interrupted = bursts.c.interrupted == True
+
+    return select(
+        bursts.c.user_id,
+        day,
+        bursts.c.course_id,
+        func.coalesce(func.sum(bursts.c.duration), 0),
+        func.count(),
+        func.count().filter(interrupted),
+        func.count().filter(and_(interrupted, bursts.c.interruption == "Self")),
+        func.count().filter(and_(interrupted, bursts.c.interruption == "Digital")),
+        func.count().filter(and_(interrupted, bursts.c.interruption == "People"))
+    ).where(*criteria).group_by(bursts.c.user_id, day, bursts.c.course_id)
+
+
+# Rebuild the burst_daily rows of users with start <= id < end from bursts
+def rebuild_burst_daily(db: Session, start: int, end: int):
+    bursts = models.Burst.__table__
+    daily = models.BurstDaily.__table__
+    totals = daily_totals(bursts.c.user_id >= start, bursts.c.user_id < end)
+
+    db.execute(delete(daily).where(
+        daily.c.user_id >= start, daily.c.user_id < end))
+    return db.execute(insert(daily).from_select(
+        ["user_id", "day", "course_id", *daily_counters], totals)).rowcount
+
+
+# Add already inserted bursts to their burst_daily rows in one statement
+def add_bursts_to_daily(db: Session, burst_ids: List[int]):
+    db.execute(bursts_to_daily(burst_ids))
+
+
+def bursts_to_daily(burst_ids: List[int]):
+    daily = models.BurstDaily.__table__
+    statement = postgresql.insert(daily).from_select(
+        ["user_id", "day", "course_id", *daily_counters],
+        daily_totals(models.Burst.__table__.c.id.in_(burst_ids)))
+    statement = statement.on_conflict_do_update(
+        index_elements=[daily.c.user_id, daily.c.day, daily.c.course_id],
+        set_={name: daily.c[name] + statement.excluded[name] for name in daily_counters})
+
+    return statement
+
+
+# Streak after a run of bursts, with the rules of insert_burst applied to
+# each burst in creation order against its own day
+def replay_streak(streak: int, last_burst_at, bursts: List[dict]):
+    for burst in bursts:
+        creation_date = burst["creation_date"]
+        day_start = datetime.combine(
+            creation_date.astimezone().date(), time.min).astimezone()
+        if last_burst_at == None:
+            streak += 1
+        elif (creation_date - last_burst_at).total_seconds() > day_in_seconds:
+            streak = 1
+        elif last_burst_at < day_start:
+            streak += 1
+        if last_burst_at == None or creation_date > last_burst_at:
+            last_burst_at = creation_date
+    return streak
+
+
+# Insert many bursts with one multi-row INSERT, skipping idempotency keys
+# already stored, then update each affected course once: streak replayed
+# over its new bursts, goal window rolled, counters incremented by the
+# inserted bursts. Returns the inserted bursts.
+def insert_bursts(db: Session, values: List[dict]):
+    courses = models.Course.__table__
+    course_ids = sorted({burst["course_id"] for burst in values})
+
+    # Lock the courses in id order so concurrent batches cannot deadlock
+    locked = db.execute(select(
+        courses.c.id, courses.c.streak, courses.c.last_burst_at
+    ).where(courses.c.id.in_(course_ids)).order_by(courses.c.id).with_for_update()).all()
+
+    inserted = [dict(row) for row in db.execute(
+        insert_bursts_statement(values)).mappings()]
+    if len(inserted) == 0:
+        return inserted
+
+    new_bursts = {}
+    for burst in sorted(inserted, key=lambda burst: burst["creation_date"]):
+        new_bursts.setdefault(burst["course_id"], []).append(burst)
+
+    for course in locked:
+        if course.id not in new_bursts:
+            continue
+        db.execute(update(courses).where(courses.c.id == course.id).values(
+            streak=replay_streak(course.streak, course.last_burst_at, new_bursts[course.id])))
+
+    burst_ids = [burst["id"] for burst in inserted]
+    roll_goal_windows(db, datetime.now().astimezone(),
+                      courses.c.id.in_(list(new_bursts)))
+    add_bursts_to_counters(db, burst_ids)
+    add_bursts_to_daily(db, burst_ids)
+
+    return inserted
+
+
+def insert_bursts_statement(values: List[dict]):
+    bursts = models.Burst.__table__
+    return postgresql.insert(bursts).values(values).on_conflict_do_nothing(
+        index_elements=[bursts.c.user_id, bursts.c.idempotency_key]
+    ).returning(*bursts.c)
+
+
+# Add already inserted bursts to their course counters in one statement,
+# reading only those bursts. Goal windows have to be rolled beforehand.
+def add_bursts_to_counters(db: Session, burst_ids: List[int]):
+    return db.execute(bursts_to_counters(burst_ids)).rowcount
+
+
+def bursts_to_counters(burst_ids: List[int]):
+    bursts = models.Burst.__table__
+    courses = models.Course.__table__
+    course = courses.alias("course")
+    week_start = func.to_timestamp(
+        epoch(course.c.goal_reset_date) - week_in_seconds,
+        type_=TIMESTAMP(timezone=True))
+
+    totals = select(
+        bursts.c.course_id,
+        func.max(bursts.c.creation_date).label("last_burst_at"),
+        func.coalesce(func.sum(bursts.c.duration), 0).label("total_duration"),
+        func.coalesce(func.sum(bursts.c.duration).filter(and_(
+            bursts.c.creation_date > week_start,
+            bursts.c.creation_date < course.c.goal_reset_date)), 0).label("current_week_duration")
+    ).join(course, course.c.id == bursts.c.course_id).where(
+        bursts.c.id.in_(burst_ids)).group_by(bursts.c.course_id).subquery()
+
+    return update(courses).where(
+        courses.c.id == totals.c.course_id
+    ).values(
+        last_burst_at=func.greatest(
+            courses.c.last_burst_at, totals.c.last_burst_at),
+        total_duration=courses.c.total_duration + totals.c.total_duration,
+        current_week_duration=courses.c.current_week_duration +
+        totals.c.current_week_duration
+    )
+
+
+# Recompute course counters from the bursts table, for existing data
+def refresh_course_counters(db: Session, *criteria):
+    bursts = models.Burst.__table__
+    courses = models.Course.__table__
+    week_start = func.to_timestamp(
+        epoch(courses.c.goal_reset_date) - week_in_seconds,
+        type_=TIMESTAMP(timezone=True))
+
+    totals = select(
+        courses.c.id.label("course_id"),
+        func.max(bursts.c.creation_date).label("last_burst_at"),
+        func.coalesce(func.sum(bursts.c.duration), 0).label("total_duration"),
+        func.coalesce(func.sum(bursts.c.duration).filter(and_(
+            bursts.c.creation_date > week_start,
+            bursts.c.creation_date < courses.c.goal_reset_date)), 0).label("current_week_duration")
+    ).join(courses, courses.c.id == bursts.c.course_id).where(
+        *criteria).group_by(courses.c.id).subquery()
+
+    statement = update(courses).where(
+        courses.c.id == totals.c.course_id
+    ).values(
+        last_burst_at=totals.c.last_burst_at,
+        total_duration=totals.c.total_duration,
+        current_week_duration=totals.c.current_week_duration
+    )
+
+    return db.execute(statement).rowcount
+
+
+# Topic count, completed count and stability sum of the completed topics per
+# group, the inputs of utils.calculate_progress and calculate_average_stability
+def topic_totals_subquery(group_column, *criteria):
+    topic = models.Topic
+    completed = topic.completed == True
+    return select(
+        group_column.label("group_id"),
+        func.count(topic.id).label("topic_count"),
+        func.count(topic.id).filter(completed).label("completed_count"),
+        func.coalesce(func.sum(topic.stability).filter(
+            completed), 0).label("stability_sum")
+    ).where(*criteria).group_by(group_column).subquery()
+
+
+def topic_totals(db: Session, group_column, *criteria):
+    totals = topic_totals_subquery(group_column, *criteria)
+    rows = db.execute(select(totals)).all()
+
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+# Tombstones for the rows a course or lesson delete cascades to, written
+# before the delete so sync clients drop the children along with the parent
+def add_cascade_tombstones(db: Session, parent_column: str, parent_id: int, children: list):
+    tombstones = models.Tombstone.__table__
+    rows = union_all(*[select(
+        model.user_id, literal_column(f"'{model.__tablename__}'", String), model.id
+    ).where(getattr(model, parent_column) == parent_id) for model in children])
+
+    return db.execute(insert(tombstones).from_select(
+        ["user_id", "table_name", "row_id"], rows)).rowcount
+
+
+# Mark users whose membership expired as inactive
+def deactivate_expired_users(db: Session, now: datetime, *criteria):
+    users = models.User.__table__
+    statement = update(users).where(
+        users.c.active == True,
+        users.c.expiry_date < now,
+        *criteria
+    ).values(active=False).returning(users.c.id)
+
+    return [row.id for row in db.execute(statement)]
+
+
+# utils.calculate_revision_date, expressed in days
+def revision_days(revision_count, intensity):
+    return case(
+        (revision_count == 0, 1),
+        (intensity == "Low", revision_count * 9),
+        (intensity == "High", revision_count * 3),
+        else_=revision_count * 6)
+
+
+# utils.decrease_topic_stability
+def decreased_stability(stability, revision_count, revision_date, now: datetime):
+    days_elapsed = func.floor(
+        (now.timestamp() - epoch(revision_date)) / day_in_seconds, type_=Float)
+    new_stability = case(
+        (revision_count == 0, stability - (10 * days_elapsed)),
+        else_=func.round(cast(stability - ((10 * days_elapsed) / revision_count), Float)))
+    return func.greatest(new_stability, 0)
+
+
+def rescheduled_revision_date(revision_count, intensity, now: datetime):
+    return func.to_timestamp(
+        now.timestamp() + (revision_days(revision_count, intensity) * day_in_seconds),
+        type_=TIMESTAMP(timezone=True))
+
+
+def revision_due(now: datetime):
+    return and_(models.Topic.revised == True, models.Topic.revision_date < now)
+
+
+def revision_overdue(now: datetime):
+    return models.Topic.revision_date < now - timedelta(seconds=day_in_seconds)
+
+
+# Number of topics update_topic_revisions would clear as due and decay as
+# overdue, without writing
+def count_topic_revisions(db: Session, now: datetime, *criteria):
+    topic = models.Topic
+    total, due, overdue = db.query(
+        func.count(topic.id),
+        func.count(topic.id).filter(revision_due(now)),
+        func.count(topic.id).filter(revision_overdue(now))
+    ).filter(or_(revision_due(now), revision_overdue(now)), *criteria).one()
+
+    return total, due, overdue
+
+
+# Set revision due, check revision overdue and decrease stability for every
+# topic matching the criteria in a single UPDATE ... FROM courses
+def update_topic_revisions(db: Session, now: datetime, *criteria):
+    topic = models.Topic
+    due = revision_due(now)
+    overdue = revision_overdue(now)
+
+    statement = update(topic).where(
+        topic.course_id == models.Course.id,
+        or_(due, overdue),
+        *criteria
+    ).values(
+        revised=case((due, False), else_=topic.revised),
+        stability=case(
+            (overdue, decreased_stability(
+                topic.stability, topic.revision_count, topic.revision_date, now)),
+            else_=topic.stability),
+        revision_date=case(
+            (overdue, rescheduled_revision_date(
+                topic.revision_count, models.Course.intensity, now)),
+            else_=topic.revision_date)
+    ).execution_options(synchronize_session=False)
+
+    return db.execute(statement).rowcount
@@ -1,5 +1,5 @@
 from enum import unique
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import JSON, Boolean, Column, Date, ForeignKey, Index, Integer, String, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.sql.expression import text
@@ -32,6 +32,10 @@ class User(Base):
 
 class Course(Base):
     __tablename__ = "courses"
+    __table_args__ = (
+        Index("ix_courses_user_id", "user_id"),
+        Index("ix_courses_user_id_updated_at", "user_id", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, nullable=False)
     name = Column(String, nullable=False)
@@ -47,9 +51,15 @@ class Course(Base):
     streak = Column(Integer, default=0)
     strength = Column(Integer, default=0)
     goal_reset_date = Column(TIMESTAMP(timezone=True))
+    last_burst_at = Column(TIMESTAMP(timezone=True))
+    total_duration = Column(Integer, nullable=False, server_default=text("0"))
+    current_week_duration = Column(
+        Integer, nullable=False, server_default=text("0"))
 
     creation_date = Column(TIMESTAMP(timezone=True),
                            server_default=text("now()"))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
+                        server_default=text("now()"), onupdate=func.now())
 
     user_id = Column(Integer, ForeignKey(
         "users.id", ondelete="CASCADE"), nullable=False)
@@ -59,6 +69,11 @@ class Course(Base):
 
 class Lesson(Base):
     __tablename__ = "lessons"
+    __table_args__ = (
+        Index("ix_lessons_course_id", "course_id"),
+        Index("ix_lessons_user_id", "user_id"),
+        Index("ix_lessons_user_id_updated_at", "user_id", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, nullable=False)
     name = Column(String, nullable=False)
@@ -68,6 +83,8 @@ class Lesson(Base):
 
     creation_date = Column(TIMESTAMP(timezone=True),
                            server_default=text("now()"))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
+                        server_default=text("now()"), onupdate=func.now())
 
     course_id = Column(Integer, ForeignKey(
         "courses.id", ondelete="CASCADE"), nullable=False)
@@ -80,6 +97,14 @@ class Lesson(Base):
 
 class Topic(Base):
     __tablename__ = "topics"
+    __table_args__ = (
+        Index("ix_topics_lesson_id_completed", "lesson_id", "completed"),
+        Index("ix_topics_course_id_completed", "course_id", "completed"),
+        Index("ix_topics_user_id", "user_id"),
+        Index("ix_topics_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_topics_due", "user_id", "revision_date",
+              postgresql_where=text("completed AND NOT revised")),
+    )
 
     id = Column(Integer, primary_key=True, nullable=False)
     name = Column(String, nullable=False)
@@ -92,6 +117,8 @@ class Topic(Base):
 
     creation_date = Column(TIMESTAMP(timezone=True),
                            server_default=text("now()"))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
+                        server_default=text("now()"), onupdate=func.now())
 
     course_id = Column(Integer, ForeignKey(
         "courses.id", ondelete="CASCADE"), nullable=False)
@@ -107,14 +134,26 @@ class Topic(Base):
 
 class Burst(Base):
     __tablename__ = "bursts"
+    __table_args__ = (
+        Index("ix_bursts_course_id_creation_date",
+              "course_id", "creation_date"),
+        Index("ix_bursts_user_id_creation_date", "user_id", "creation_date"),
+        Index("ix_bursts_lesson_id", "lesson_id"),
+        Index("ix_bursts_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_bursts_user_id_idempotency_key",
+              "user_id", "idempotency_key", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, nullable=False)
     duration = Column(Integer, default=0)
     interrupted = Column(Boolean, default=False)
     interruption = Column(String)
+    idempotency_key = Column(String)
 
     creation_date = Column(TIMESTAMP(timezone=True),
                            server_default=text("now()"))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
+                        server_default=text("now()"), onupdate=func.now())
 
     course_id = Column(Integer, ForeignKey(
         "courses.id", ondelete="CASCADE"), nullable=False)
@@ -128,8 +167,51 @@ class Burst(Base):
     user = relationship("User")
 
 
+# Bursts summed per user, day and course, maintained by metrics.insert_burst
+class BurstDaily(Base):
+    __tablename__ = "burst_daily"
+    __table_args__ = (
+        Index("ix_burst_daily_course_id_day", "course_id", "day"),
+    )
+
+    user_id = Column(Integer, ForeignKey(
+        "users.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    day = Column(Date, primary_key=True, nullable=False)
+    course_id = Column(Integer, ForeignKey(
+        "courses.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    total_duration = Column(Integer, nullable=False, server_default=text("0"))
+    burst_count = Column(Integer, nullable=False, server_default=text("0"))
+    interrupted_count = Column(
+        Integer, nullable=False, server_default=text("0"))
+    self_count = Column(Integer, nullable=False, server_default=text("0"))
+    digital_count = Column(Integer, nullable=False, server_default=text("0"))
+    people_count = Column(Integer, nullable=False, server_default=text("0"))
+
+
+# Deletions made through the delete routes, for delta sync clients. Rows
+# removed by cascade are not recorded, clients cascade locally.
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+    __table_args__ = (
+        Index("ix_tombstones_user_id_deleted_at", "user_id", "deleted_at"),
+    )
+
+    id = Column(Integer, primary_key=True, nullable=False)
+    user_id = Column(Integer, ForeignKey(
+        "users.id", ondelete="CASCADE"), nullable=False)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    deleted_at = Column(TIMESTAMP(timezone=True), nullable=False,
+                        server_default=text("now()"))
+
+
 class Invite(Base):
     __tablename__ = "invites"
+    __table_args__ = (
+        Index("ix_invites_invite_code", "invite_code"),
+        Index("ix_invites_event_id", "event_id"),
+        Index("ix_invites_email", "email"),
+    )
 
     id = Column(Integer, primary_key=True, nullable=False)
     invite_code = Column(String, nullable=False)
@@ -144,3 +226,39 @@ class Invite(Base):
 
     creation_date = Column(TIMESTAMP(timezone=True),
                            server_default=text("now()"))
+
+
+class OutboxEmail(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index("ix_outbox_pending", "next_attempt_date",
+              postgresql_where=text("sent_date IS NULL")),
+    )
+
+    id = Column(Integer, primary_key=True, nullable=False)
+    subject = Column(String, nullable=False)
+    recipients = Column(JSON, nullable=False)
+    template_name = Column(String, nullable=False)
+    template_body = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, server_default=text("0"))
+    last_error = Column(String)
+    next_attempt_date = Column(TIMESTAMP(timezone=True),
+                               server_default=text("now()"))
+    sent_date = Column(TIMESTAMP(timezone=True))
+
+    creation_date = Column(TIMESTAMP(timezone=True),
+                           server_default=text("now()"))
+
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    id = Column(String, primary_key=True, nullable=False)
+    amount = Column(Integer, nullable=False)
+    currency = Column(String, nullable=False)
+    renewal = Column(Boolean, default=False)
+    status = Column(String, nullable=False, server_default="created")
+    payment_id = Column(String)
+
+    creation_date = Column(TIMESTAMP(timezone=True),
+                           server_default=text("now()"))
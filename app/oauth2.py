@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
 from . import schemas, database, models
+from .cache import TTLCache
 from .config import settings
 
 
@@ -15,6 +16,9 @@ SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+# Per-process cache of authenticated users, keyed by the id in the token
+user_cache = TTLCache(settings.user_cache_size, settings.user_cache_ttl)
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -43,11 +47,44 @@ def verify_access_token(token: str, credentials_exception):
     return token_data
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+def get_user(db: Session, id):
+    return db.query(models.User).filter(models.User.id == id).first()
+
+
+# Look up the user to authenticate and give the connection back at once.
+# GET routes hold a read session for the rest of the request, a held auth
+# connection would double the connections per request on a cold cache.
+def get_user_and_release(db: Session, id):
+    user = get_user(db, id)
+    db.close()
+    return user
+
+
+# Drop a cached user after changing its superuser, active or expiry_date
+def invalidate_user(id):
+    user_cache.invalidate(int(id))
+
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+    # Repeated lookups within one request are free
+    current_user = getattr(request.state, "current_user", None)
+    if current_user != None:
+        return current_user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED, detail="Unable to authorize. Please try logging in again.", headers={"WWW-Authenticate": "Bearer"})
 
     token = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
 
-    return user
+    # asyncpg does not compare the string id of the token with an integer
+    current_user = user_cache.get(int(token.id))
+    if current_user == None:
+        user = await database.run_sync(db, get_user_and_release, int(token.id))
+        if user == None:
+            raise credentials_exception
+        current_user = schemas.CurrentUser.from_orm(user)
+        user_cache.set(current_user.id, current_user)
+
+    request.state.current_user = current_user
+
+    return current_user
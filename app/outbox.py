@@ -0,0 +1,220 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from pathlib import Path
+from time import perf_counter
+from typing import List
+
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import mail
+from .database import SessionLocal
+
+
+# Transactional email outbox. Routes enqueue rows in the same transaction as
+# the invite or reset code, a worker drains them over one SMTP connection.
+# Usage as a standalone worker: python -m app.outbox
+
+logger = logging.getLogger(__name__)
+
+templates = Environment(
+    loader=FileSystemLoader(Path(__file__).parent /
+                            "routers" / mail.template_folder),
+    autoescape=select_autoescape(["html"]))
+
+# Claimed emails are leased for this long. outbox_smtp_timeout and
+# outbox_batch_timeout keep the sending of a batch well inside it.
+lease = timedelta(minutes=5)
+
+# Errors after which no email of the batch can go through, unlike a refusal
+connection_errors = (aiosmtplib.SMTPConnectError, aiosmtplib.SMTPServerDisconnected,
+                     aiosmtplib.SMTPTimeoutError, aiosmtplib.SMTPAuthenticationError, OSError)
+
+wakeup = None
+worker_loop = None
+
+
+def enqueue(db: Session, subject: str, recipients: List[str], template_name: str, template_body: dict):
+    body = {key: str(value) for key, value in template_body.items()}
+    email = models.OutboxEmail(subject=subject, recipients=recipients,
+                               template_name=template_name, template_body=body)
+    db.add(email)
+    return email
+
+
+# Let the worker of this process send right away instead of on the next poll
+def wake():
+    if wakeup != None:
+        worker_loop.call_soon_threadsafe(wakeup.set)
+
+
+def claim_batch(size: int):
+    db = SessionLocal()
+    try:
+        now = datetime.now().astimezone()
+        emails = db.query(models.OutboxEmail).filter(
+            models.OutboxEmail.sent_date == None,
+            models.OutboxEmail.next_attempt_date <= now
+        ).order_by(models.OutboxEmail.id).limit(size).with_for_update(skip_locked=True).all()
+
+        # Lease the batch so other workers skip it while it is being sent
+        batch = []
+        for email in emails:
+            email.next_attempt_date = now + lease
+            batch.append({
+                "id": email.id,
+                "subject": email.subject,
+                "recipients": email.recipients,
+                "template_name": email.template_name,
+                "template_body": email.template_body,
+            })
+        db.commit()
+
+        return batch
+    finally:
+        db.close()
+
+
+# Store the outcome of the sent emails. Unsent ones were never handed to the
+# server, they are retried after one backoff without using up an attempt.
+def record_results(results: List[dict], unsent: List[int], error: str = None):
+    db = SessionLocal()
+    try:
+        now = datetime.now().astimezone()
+        if len(unsent) > 0:
+            db.query(models.OutboxEmail).filter(
+                models.OutboxEmail.id.in_(unsent)
+            ).update({
+                models.OutboxEmail.next_attempt_date: now + timedelta(seconds=mail.outbox_backoff),
+                models.OutboxEmail.last_error: error,
+            }, synchronize_session=False)
+
+        for result in results:
+            email = db.query(models.OutboxEmail).filter(
+                models.OutboxEmail.id == result["id"]).first()
+            if email == None:
+                continue
+            if result["error"] == None:
+                email.sent_date = now
+                email.last_error = None
+                continue
+
+            # Exponential backoff, give up after outbox_max_attempts
+            email.attempts += 1
+            email.last_error = result["error"]
+            if email.attempts >= mail.outbox_max_attempts:
+                email.next_attempt_date = None
+            else:
+                email.next_attempt_date = now + \
+                    timedelta(seconds=mail.outbox_backoff *
+                              2 ** (email.attempts - 1))
+        db.commit()
+    finally:
+        db.close()
+
+
+def build_message(email: dict):
+    message = EmailMessage()
+    message["Subject"] = email["subject"]
+    message["From"] = formataddr((mail.mail_from_name, mail.mail_from))
+    message["To"] = ", ".join(email["recipients"])
+    html = templates.get_template(
+        email["template_name"]).render(**email["template_body"])
+    message.set_content(html, subtype="html")
+    return message
+
+
+async def connect():
+    smtp = aiosmtplib.SMTP(hostname=mail.mail_server, port=mail.mail_port, use_tls=mail.mail_ssl,
+                           validate_certs=mail.validate_certs, timeout=mail.outbox_smtp_timeout)
+    await smtp.connect()
+    if mail.mail_tls:
+        await smtp.starttls()
+    if mail.use_credentials:
+        await smtp.login(mail.mail_username, mail.mail_password)
+    return smtp
+
+
+# Send one claimed batch over one connection, returns the number of emails
+# processed. A connection error or the end of outbox_batch_timeout stops the
+# batch, the rest is released long before its lease runs out.
+async def drain():
+    batch = await run_in_threadpool(claim_batch, mail.outbox_batch_size)
+    if len(batch) == 0:
+        return 0
+
+    start = perf_counter()
+    results = []
+    unsent = [email["id"] for email in batch]
+    error = None
+    smtp = None
+    try:
+        smtp = await connect()
+
+        for email in batch:
+            if perf_counter() - start > mail.outbox_batch_timeout:
+                error = "Batch timeout reached"
+                break
+
+            unsent.remove(email["id"])
+            try:
+                await smtp.send_message(build_message(email))
+                results.append({"id": email["id"], "error": None})
+            except connection_errors as send_error:
+                results.append({"id": email["id"], "error": repr(send_error)})
+                raise
+            except Exception as send_error:
+                results.append({"id": email["id"], "error": repr(send_error)})
+    except connection_errors as connection_error:
+        error = repr(connection_error)
+
+    if smtp != None and smtp.is_connected:
+        try:
+            await smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            pass
+
+    logger.info("Outbox sent %d emails in %.1f ms", len(results),
+                (perf_counter() - start) * 1000)
+
+    failed = [result for result in results if result["error"] != None]
+    if len(failed) > 0:
+        logger.warning("Outbox failed to send %d of %d emails: %s",
+                       len(failed), len(batch), failed[0]["error"])
+    if len(unsent) > 0:
+        logger.warning("Outbox released %d unsent emails: %s",
+                       len(unsent), error)
+
+    await run_in_threadpool(record_results, results, unsent, error)
+    return len(batch)
+
+
+async def run_worker():
+    global wakeup, worker_loop
+    worker_loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    while True:
+        try:
+            processed = await drain()
+        except Exception:
+            logger.exception("Outbox worker failed to drain")
+            processed = 0
+
+        # Keep draining while there is a backlog, otherwise wait for a poke
+        if processed < mail.outbox_batch_size:
+            try:
+                await asyncio.wait_for(wakeup.wait(), mail.outbox_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker())
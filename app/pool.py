@@ -0,0 +1,70 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+# Per-process connection pool telemetry, one PoolStats per pool class
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_checkouts = 0
+        self.overflow_peak = 0
+
+    def record(self, wait: float, overflow: int, timed_out: bool = False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                if overflow > 0:
+                    self.overflow_checkouts += 1
+                    self.overflow_peak = max(self.overflow_peak, overflow)
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self, pool: QueuePool):
+        with self.lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "overflow_peak": self.overflow_peak,
+                "overflow_checkouts": self.overflow_checkouts,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / attempts * 1000, 3) if attempts > 0 else 0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+# Time how long each checkout waits on the queue. Pools are recreated with
+# self.__class__ on dispose, so the stats live on the class.
+class TimedPoolMixin:
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start,
+                              self.overflow(), timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start, self.overflow())
+        return connection
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    stats = PoolStats()
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
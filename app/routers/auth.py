@@ -2,30 +2,38 @@ from fastapi import APIRouter, Depends, status, HTTPException
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
 
-from .. import database, models, utils, oauth2
+from .. import database, models, hashing, oauth2
 
 
 router = APIRouter(tags=["Authentication"])
 
 
-@router.post("/api/login")
-def login(credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-
+def get_login_user(db: Session, username: str):
     user = db.query(models.User).filter(
-        models.User.username == credentials.username).first()
+        models.User.username == username).first()
 
     if not user:
         user = db.query(models.User).filter(
-            models.User.email == credentials.username).first()
+            models.User.email == username).first()
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Please ensure the username and password you've entered is correct.")
 
-    if not utils.verify(credentials.password, user.password):
+    # Give the connection back before the password check, bcrypt is slow
+    db.close()
+    return user.id, user.password
+
+
+@router.post("/api/login")
+async def login(credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+
+    id, hashed_password = await database.run_sync(db, get_login_user, credentials.username)
+
+    if not await hashing.verify(credentials.password, hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Please ensure the username and password you've entered is correct.")
 
     # Create access token
-    access_token = oauth2.create_access_token(data={"id": user.id})
+    access_token = oauth2.create_access_token(data={"id": id})
 
     return access_token
@@ -1,8 +1,13 @@
-from typing import List
-from fastapi import APIRouter, Depends, status
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from uuid import uuid4
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from .. import database, models, schemas, utils, oauth2
+from .. import database, models, schemas, oauth2, metrics, writebehind
+from ..config import settings
 
 router = APIRouter(
     prefix="/api/bursts",
@@ -10,55 +15,135 @@ router = APIRouter(
 )
 
 
+def check_burst_lesson(db: Session, burst: schemas.BurstCreate, current_user):
+    lesson = db.query(models.Lesson.course_id).filter(
+        models.Lesson.id == burst.lesson_id,
+        models.Lesson.user_id == current_user.id).first()
+    if lesson == None or lesson.course_id != burst.course_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access denied.")
+
+
+def add_burst(db: Session, burst: schemas.BurstCreate, current_user):
+    # Insert burst, increment streak and update course counters atomically
+    new_burst = metrics.insert_burst(
+        db, dict(user_id=current_user.id, **burst.dict()))
+    db.commit()
+
+    return new_burst
+
+
 # Create burst
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_burst(burst: schemas.BurstCreate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    new_burst = models.Burst(user_id=current_user.id, **burst.dict())
-    course = db.query(models.Course).filter(
-        models.Course.id == new_burst.course_id).first()
+async def create_burst(burst: schemas.BurstCreate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    # Write-behind mode, the burst is spooled and inserted by the next flush.
+    # Ownership is checked here since a flush cannot reject single bursts.
+    if settings.burst_write_behind:
+        await database.run_sync(db, check_burst_lesson, burst, current_user)
 
-    # Get bursts to calculate course metrics
-    course_bursts = db.query(models.Burst).filter(
-        models.Burst.course_id == new_burst.course_id).all()
+        values = dict(burst.dict(), user_id=current_user.id, idempotency_key=uuid4().hex,
+                      creation_date=datetime.now().astimezone())
+        if await writebehind.enqueue(values):
+            return ORJSONResponse(dict(values, id=None), status_code=status.HTTP_202_ACCEPTED)
 
-    # Check and increment streak
-    if utils.increment_course_streak(course_bursts):
-        course.streak += 1
+    return await database.run_sync(db, add_burst, burst, current_user)
 
-    db.add(new_burst)
+
+# Create bursts queued by an offline client. Retried items are recognised
+# by their idempotency key, each item gets a created, duplicate or
+# rejected (lesson not owned or not in the course) result.
+@router.post("/batch", response_model=List[schemas.BurstBatchResult])
+@database.session_route
+def create_bursts(batch: schemas.BurstBatch, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    if len(batch.bursts) > settings.burst_batch_size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {settings.burst_batch_size} bursts per batch.")
+
+    # Check ownership of every lesson and its course in one query
+    owned = set(db.query(models.Lesson.id, models.Lesson.course_id).filter(
+        models.Lesson.id.in_({burst.lesson_id for burst in batch.bursts}),
+        models.Lesson.user_id == current_user.id).all())
+
+    now = datetime.now().astimezone()
+    values = []
+    for burst in batch.bursts:
+        if (burst.lesson_id, burst.course_id) in owned:
+            values.append(dict(burst.dict(exclude={"creation_date"}), user_id=current_user.id,
+                               creation_date=burst.creation_date or now))
+
+    created = {}
+    if len(values) > 0:
+        created = {new_burst["idempotency_key"]: new_burst["id"]
+                   for new_burst in metrics.insert_bursts(db, values)}
+
+    # Ids of the keys stored by an earlier attempt
+    existing = dict(db.query(models.Burst.idempotency_key, models.Burst.id).filter(
+        models.Burst.user_id == current_user.id,
+        models.Burst.idempotency_key.in_([value["idempotency_key"] for value in values
+                                          if value["idempotency_key"] not in created])).all())
     db.commit()
-    db.refresh(new_burst)
 
-    return new_burst
+    results = []
+    for burst in batch.bursts:
+        key = burst.idempotency_key
+        if (burst.lesson_id, burst.course_id) not in owned:
+            results.append({"idempotency_key": key, "status": "rejected", "id": None})
+        elif key in created:
+            results.append({"idempotency_key": key, "status": "created", "id": created.pop(key)})
+            existing[key] = results[-1]["id"]
+        else:
+            results.append({"idempotency_key": key, "status": "duplicate", "id": existing.get(key)})
+
+    return results
 
 
-# Get burst interruptions data for a particular user
+# Get burst interruptions data for a particular user, optionally for a
+# single course and a creation date range
 @router.get("/interruptions")
-def get_interruptions(db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    bursts = db.query(models.Burst).filter(
-        models.Burst.user_id == current_user.id).all()
-
-    self_interrupted = 0
-    digital_interrupted = 0
-    people_interrupted = 0
-    uninterrupted = 0
-
-    for burst in bursts:
-        if not burst.interrupted:
-            uninterrupted += 1
-        else:
-            if burst.interruption == "Self":
-                self_interrupted += 1
-            elif burst.interruption == "Digital":
-                digital_interrupted += 1
-            elif burst.interruption == "People":
-                people_interrupted += 1
-
-    data = [
-        {"name": "Self", "value": self_interrupted},
-        {"name": "Digital", "value": digital_interrupted},
-        {"name": "People", "value": people_interrupted},
-        {"name": "Uninterrupted", "value": uninterrupted}
-    ]
+@database.session_route
+def get_interruptions(course_id: Optional[int] = None, since: Optional[datetime] = None, until: Optional[datetime] = None, db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    query = db.query(
+        models.Burst.interrupted, models.Burst.interruption, func.count()
+    ).filter(models.Burst.user_id == current_user.id)
+
+    if course_id != None:
+        query = query.filter(models.Burst.course_id == course_id)
+    if since != None:
+        query = query.filter(models.Burst.creation_date >= since)
+    if until != None:
+        query = query.filter(models.Burst.creation_date < until)
+
+    counts = {"Self": 0, "Digital": 0, "People": 0, "Uninterrupted": 0}
+    for interrupted, interruption, count in query.group_by(
+            models.Burst.interrupted, models.Burst.interruption).all():
+        if not interrupted:
+            counts["Uninterrupted"] += count
+        elif interruption in counts and interruption != "Uninterrupted":
+            counts[interruption] += count
+
+    data = [{"name": name, "value": value} for name, value in counts.items()]
 
     return data
+
+
+# Get daily study time for a heatmap, optionally for a single course
+@router.get("/heatmap", response_model=List[schemas.BurstDay])
+@database.session_route
+def get_heatmap(days: int = Query(365, ge=1, le=1000), course_id: Optional[int] = None, db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    return heatmap_days(db, current_user.id, days, course_id).all()
+
+
+def heatmap_days(db: Session, user_id: int, days: int, course_id: Optional[int]):
+    daily = models.BurstDaily
+    query = db.query(
+        daily.day,
+        func.sum(daily.total_duration).label("total_duration"),
+        func.sum(daily.burst_count).label("burst_count")
+    ).filter(
+        daily.user_id == user_id,
+        daily.day > date.today() - timedelta(days=days))
+
+    if course_id != None:
+        query = query.filter(daily.course_id == course_id)
+
+    return query.group_by(daily.day).order_by(daily.day)
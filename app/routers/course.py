@@ -3,7 +3,7 @@ from typing import List
 from fastapi import APIRouter, HTTPException, Depends, status
 from sqlalchemy.orm import Session
 
-from .. import database, models, schemas, oauth2, utils
+from .. import database, models, schemas, oauth2, utils, metrics, serializers
 
 
 router = APIRouter(
@@ -14,6 +14,7 @@ router = APIRouter(
 
 # Create course
 @router.post("/", status_code=status.HTTP_201_CREATED)
+@database.session_route
 def create_course(course: schemas.CourseCreate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     new_course = models.Course(user_id=current_user.id, **course.dict())
     new_course.goal_reset_date = utils.calculate_goal_reset_date(
@@ -27,7 +28,8 @@ def create_course(course: schemas.CourseCreate, db: Session = Depends(database.g
 
 # Get single course
 @router.get("/{id}", response_model=schemas.CourseGet)
-def get_course(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+@database.session_route
+def get_course(id: int, db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
     course = db.query(models.Course).filter(models.Course.id == id).first()
 
     if not course:
@@ -37,85 +39,35 @@ def get_course(id: int, db: Session = Depends(database.get_db), current_user=Dep
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
 
-    # Get bursts to calculate course metrics
-    course_bursts = db.query(models.Burst).filter(
-        models.Burst.course_id == id).all()
+    # Calculate streak, strength, progress, stability, goal and velocities
+    totals = metrics.topic_totals(
+        db, models.Topic.course_id, models.Topic.course_id == id)
+    course_metrics = utils.calculate_course_metrics(
+        course, *totals.get(id, (0, 0, 0)))
 
-    # Check and reset course streak
-    if utils.reset_course_streak(course_bursts):
-        course.streak = 0
-
-    # Calculate course strength
-    course.strength = utils.calculate_course_strength(course_bursts)
-
-    topics = db.query(models.Topic).filter(models.Topic.course_id == id).all()
-    completed_topics = list(
-        filter(lambda topic: topic.completed == True, topics))
-
-    # Calculate overall course progress
-    course.progress = utils.calculate_overall_progress(topics)
-
-    # Calculate overall course stability
-    course.stability = utils.calculate_overall_stability(completed_topics)
-
-    # Calculate current course velocity
-    if course.progress < 100:
-        course.current_velocity = utils.calculate_current_velocity(
-            course.creation_date, course.progress)
-
-    # Calculate required course velocity
-    course.required_velocity = utils.calculate_required_velocity(
-        course.deadline, course.progress)
-
-    db.commit()
-    db.refresh(course)
-
-    return course
+    return schemas.CourseGet.from_orm(course).copy(update=course_metrics)
 
 
 # Get all courses for current user
 @router.get("/", response_model=List[schemas.CourseGet])
-def get_courses(db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+@database.session_route
+def get_courses(db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
     courses = db.query(models.Course).filter(
         models.Course.user_id == current_user.id).all()
 
-    for course in courses:
-        # Get bursts to calculate course goal
-        course_bursts = db.query(models.Burst).filter(
-            models.Burst.course_id == course.id).all()
-
-        # Calculate course goal reset date
-        if datetime.now().timestamp() > course.goal_reset_date.timestamp():
-            course.goal_reset_date = utils.calculate_goal_reset_date(
-                course.goal_reset_date)
-            course.goal_status = 0
-
-        # Calculate course goal status
-        course.goal_status = utils.calculate_goal_status(course_bursts, course)
-
-        # Get topics to calculate topic metrics
-        topics = db.query(models.Topic).filter(
-            models.Topic.course_id == course.id).all()
-
-        # Set revision due, check revision overdue and decrease stability
-        for topic in topics:
-            if topic.revision_date != None and topic.revised == True and utils.revision_due(topic.revision_date):
-                topic.revised = False
-            if topic.revision_date != None and not topic.revised and utils.revision_overdue(topic.revision_date):
-                topic.stability = utils.decrease_topic_stability(
-                    topic.stability, topic.revision_count, topic.revision_date)
-                topic.revision_date = utils.calculate_revision_date(
-                    topic.revision_count, course.intensity)
-
-    db.commit()
-    for course in courses:
-        db.refresh(course)
+    # Calculate course metrics from one aggregate over the user's topics
+    totals = metrics.topic_totals(
+        db, models.Topic.course_id, models.Topic.user_id == current_user.id)
 
-    return courses
+    return serializers.list_response([{
+        **serializers.object_dict(course, schemas.CourseGet),
+        **utils.calculate_course_metrics(course, *totals.get(course.id, (0, 0, 0)))
+    } for course in courses])
 
 
 # Update course
 @router.put("/", status_code=status.HTTP_200_OK)
+@database.session_route
 def update_course(updated_course: schemas.CourseUpdate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     course_query = db.query(models.Course).filter(
         models.Course.id == updated_course.id)
@@ -137,6 +89,7 @@ def update_course(updated_course: schemas.CourseUpdate, db: Session = Depends(da
 
 # Delete course
 @router.delete("/{id}")
+@database.session_route
 def delete_course(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     course_query = db.query(models.Course).filter(models.Course.id == id)
     course = course_query.first()
@@ -151,7 +104,11 @@ def delete_course(id: int, db: Session = Depends(database.get_db), current_user=
 
     course_id = course.id
 
+    metrics.add_cascade_tombstones(
+        db, "course_id", course_id, [models.Lesson, models.Topic, models.Burst])
     course_query.delete(synchronize_session=False)
+    db.add(models.Tombstone(user_id=current_user.id,
+                            table_name="courses", row_id=course_id))
     db.commit()
 
     return course_id
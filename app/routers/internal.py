@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from .. import database, oauth2
+
+
+router = APIRouter(
+    prefix="/api/internal",
+    tags=["Internal"]
+)
+
+
+# Sudo get connection pool stats of the worker serving the request
+@router.get("/pool")
+@database.session_route
+def get_pool_stats(db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    if not current_user.superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
+
+    return database.pool_stats()
@@ -2,7 +2,7 @@ from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
-from .. import models, schemas, database, oauth2, utils
+from .. import models, schemas, database, oauth2, utils, metrics, serializers
 
 
 router = APIRouter(
@@ -13,6 +13,7 @@ router = APIRouter(
 
 # Create lesson
 @router.post("/", status_code=status.HTTP_201_CREATED)
+@database.session_route
 def create_lesson(lesson: schemas.LessonCreate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     new_lesson = models.Lesson(user_id=current_user.id, **lesson.dict())
 
@@ -25,35 +26,48 @@ def create_lesson(lesson: schemas.LessonCreate, db: Session = Depends(database.g
 
 # Get all lessons of a particular course
 @router.get("/course/{id}", response_model=List[schemas.LessonGet])
-def get_lessons(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-
-    lessons = db.query(models.Lesson).filter(
-        models.Lesson.course_id == id).all()
-
-    for lesson in lessons:
-        # Get topics to calculate lesson metrics
-        topics = db.query(models.Topic).filter(
-            models.Topic.lesson_id == lesson.id).all()
-
-        completed_topics = list(
-            filter(lambda topic: topic.completed == True, topics))
-
-        # Calculate overall lesson progress
-        lesson.progress = utils.calculate_overall_progress(topics)
+@database.session_route
+def get_lessons(id: int, db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+
+    # Course owner, lessons and their topic totals in one query
+    totals = metrics.topic_totals_subquery(
+        models.Topic.lesson_id, models.Topic.course_id == id)
+    rows = db.query(
+        models.Course.user_id.label("owner_id"), totals.c.topic_count, totals.c.completed_count,
+        totals.c.stability_sum, *serializers.schema_columns(models.Lesson, schemas.LessonGet)
+    ).select_from(models.Course).outerjoin(
+        models.Lesson, models.Lesson.course_id == models.Course.id
+    ).outerjoin(
+        totals, totals.c.group_id == models.Lesson.id
+    ).filter(models.Course.id == id).order_by(models.Lesson.id).all()
+
+    if len(rows) == 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Course with id: {id} does not exist.")
 
-        # Calculate overall lesson stability
-        lesson.stability = utils.calculate_overall_stability(completed_topics)
+    if rows[0].owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access denied.")
 
-    db.commit()
-    for lesson in lessons:
-        db.refresh(lesson)
+    # Calculate overall lesson progress and stability
+    lessons = []
+    for _, topic_count, completed_count, stability_sum, *columns in rows:
+        lesson = serializers.row_dict(columns, schemas.LessonGet)
+        if lesson["id"] == None:
+            continue
+        lesson["progress"] = utils.calculate_progress(
+            completed_count or 0, topic_count or 0)
+        lesson["stability"] = utils.calculate_average_stability(
+            stability_sum or 0, completed_count or 0)
+        lessons.append(lesson)
 
-    return lessons
+    return serializers.list_response(lessons)
 
 
 # Get single lesson
 @router.get("/{id}", response_model=schemas.LessonGet)
-def get_lesson(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+@database.session_route
+def get_lesson(id: int, db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
     lesson = db.query(models.Lesson).filter(models.Lesson.id == id).first()
 
     if not lesson:
@@ -69,20 +83,16 @@ def get_lesson(id: int, db: Session = Depends(database.get_db), current_user=Dep
     completed_topics = list(
         filter(lambda topic: topic.completed == True, topics))
 
-    # Calculate overall lesson progress
-    lesson.progress = utils.calculate_overall_progress(topics)
-
-    # Calculate overall lesson stability
-    lesson.stability = utils.calculate_overall_stability(completed_topics)
-
-    db.commit()
-    db.refresh(lesson)
-
-    return lesson
+    # Calculate overall lesson progress and stability
+    return schemas.LessonGet.from_orm(lesson).copy(update={
+        "progress": utils.calculate_overall_progress(topics),
+        "stability": utils.calculate_overall_stability(completed_topics),
+    })
 
 
 # Update lesson
 @router.put("/", status_code=status.HTTP_200_OK)
+@database.session_route
 def update_lesson(updated_lesson: schemas.LessonUpdate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     lesson_query = db.query(models.Lesson).filter(
         models.Lesson.id == updated_lesson.id)
@@ -105,6 +115,7 @@ def update_lesson(updated_lesson: schemas.LessonUpdate, db: Session = Depends(da
 
 # Delete lesson
 @router.delete("/{id}")
+@database.session_route
 def delete_lesson(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     lesson_query = db.query(models.Lesson).filter(models.Lesson.id == id)
     lesson = lesson_query.first()
@@ -119,7 +130,11 @@ def delete_lesson(id: int, db: Session = Depends(database.get_db), current_user=
 
     lesson_id = lesson.id
 
+    metrics.add_cascade_tombstones(
+        db, "lesson_id", lesson_id, [models.Topic, models.Burst])
     lesson_query.delete(synchronize_session=False)
+    db.add(models.Tombstone(user_id=current_user.id,
+                            table_name="lessons", row_id=lesson_id))
     db.commit()
 
     return lesson_id
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .. import database, models, schemas, oauth2, serializers
+
+
+router = APIRouter(
+    prefix="/api",
+    tags=["Sync"]
+)
+
+epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Transactions still running when a sync starts commit rows with an older
+# updated_at than the cursor handed out. Cursors are moved back by this much
+# so those rows are sent again on the next sync instead of missed.
+cursor_overlap = timedelta(seconds=5)
+
+synced_tables = {
+    "courses": (models.Course, schemas.CourseGet),
+    "lessons": (models.Lesson, schemas.LessonGet),
+    "topics": (models.Topic, schemas.TopicGet),
+    "bursts": (models.Burst, schemas.BurstGet),
+}
+
+
+# Get the rows changed and deleted since a cursor, everything without one.
+# A deleted course or lesson comes with the tombstones of its children.
+# Read from the primary, a lagging replica could hand out a cursor past rows
+# it has not replayed yet.
+@router.get("/sync", response_model=schemas.SyncChanges)
+@database.session_route
+def get_changes(since: Optional[str] = None, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    changed_after = None
+    if since != None:
+        try:
+            changed_after = decode_cursor(since)
+        except (ValueError, OverflowError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+    started_at = db.query(func.now()).scalar()
+
+    changes = {"cursor": encode_cursor(started_at - cursor_overlap)}
+    for name, (model, schema) in synced_tables.items():
+        changes[name] = serializers.row_dicts(changed_rows(
+            db, model, schema, current_user.id, changed_after).all(), schema)
+
+    changes["deleted"] = []
+    if changed_after != None:
+        changes["deleted"] = [{"table": table_name, "id": row_id} for table_name, row_id in deleted_rows(
+            db, current_user.id, changed_after).all()]
+
+    return serializers.list_response(changes)
+
+
+# Rows of a synced table changed after the cursor, all of them without one
+def changed_rows(db: Session, model, schema, user_id: int, changed_after: Optional[datetime]):
+    query = db.query(*serializers.schema_columns(model, schema)).filter(
+        model.user_id == user_id)
+    if changed_after != None:
+        query = query.filter(model.updated_at > changed_after)
+    return query.order_by(model.id)
+
+
+def deleted_rows(db: Session, user_id: int, changed_after: datetime):
+    return db.query(models.Tombstone.table_name, models.Tombstone.row_id).filter(
+        models.Tombstone.user_id == user_id,
+        models.Tombstone.deleted_at > changed_after).order_by(models.Tombstone.id)
+
+
+# Cursors are a timestamp in epoch microseconds
+def encode_cursor(timestamp: datetime):
+    return str((timestamp - epoch) // timedelta(microseconds=1))
+
+
+def decode_cursor(cursor: str):
+    return epoch + timedelta(microseconds=int(cursor))
@@ -1,8 +1,11 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import cast, column, insert, tuple_, update, values
 from sqlalchemy.orm import Session
 
-from .. import models, schemas, database, oauth2, utils
+from .. import models, schemas, database, oauth2, utils, serializers
+from ..config import settings
 
 
 router = APIRouter(
@@ -10,9 +13,12 @@ router = APIRouter(
     tags=["Topics"]
 )
 
+epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 
 # Create topic
 @router.post("/", status_code=status.HTTP_201_CREATED)
+@database.session_route
 def create_topic(topic: schemas.TopicCreate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     new_topic = models.Topic(user_id=current_user.id, **topic.dict())
 
@@ -23,19 +29,166 @@ def create_topic(topic: schemas.TopicCreate, db: Session = Depends(database.get_
     return new_topic
 
 
+# Create many topics at once, all lessons must belong to the current user
+@router.post("/bulk", status_code=status.HTTP_201_CREATED, response_model=List[schemas.TopicGet])
+@database.session_route
+def create_topics(topics: List[schemas.TopicCreate], db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    check_batch_size(topics)
+
+    # Check ownership of every lesson and its course in one query
+    owned = set(db.query(models.Lesson.id, models.Lesson.course_id).filter(
+        models.Lesson.id.in_({topic.lesson_id for topic in topics}),
+        models.Lesson.user_id == current_user.id).all())
+    if any((topic.lesson_id, topic.course_id) not in owned for topic in topics):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access denied.")
+
+    if len(topics) == 0:
+        return []
+
+    # One multi-row INSERT
+    new_topics = db.execute(insert(models.Topic.__table__).values(
+        [dict(topic.dict(), user_id=current_user.id) for topic in topics]
+    ).returning(*serializers.schema_columns(models.Topic, schemas.TopicGet))).all()
+    db.commit()
+
+    return serializers.list_response(serializers.row_dicts(new_topics, schemas.TopicGet), status_code=status.HTTP_201_CREATED)
+
+
+# Update many topics at once, with the revision rules of update_topic
+@router.patch("/bulk", response_model=List[schemas.TopicGet])
+@database.session_route
+def update_topics(updated_topics: List[schemas.TopicUpdate], db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    check_batch_size(updated_topics)
+
+    ids = [updated_topic.id for updated_topic in updated_topics]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Duplicate topic ids.")
+
+    # Current state, owner and course intensity of every topic in one query
+    topics = {topic.id: topic for topic in db.query(
+        models.Topic.id, models.Topic.user_id, models.Topic.completed,
+        models.Topic.revised, models.Topic.stability, models.Course.intensity
+    ).join(models.Course, models.Course.id == models.Topic.course_id).filter(models.Topic.id.in_(ids)).all()}
+
+    missing = [id for id in ids if id not in topics]
+    if len(missing) > 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Topic with id: {missing[0]} does not exist.")
+
+    if any(topic.user_id != current_user.id for topic in topics.values()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access denied.")
+
+    if len(updated_topics) == 0:
+        return []
+
+    rows = []
+    for updated_topic in updated_topics:
+        topic = topics[updated_topic.id]
+
+        # Calculate revision date and increase topic stability, if it's a
+        # topic completion or revision
+        if updated_topic.completed != topic.completed or updated_topic.revised != topic.revised:
+            updated_topic.revision_date = utils.calculate_revision_date(
+                updated_topic.revision_count, topic.intensity)
+            updated_topic.stability = utils.increase_topic_stability(
+                topic.stability)
+
+        rows.append(tuple(updated_topic.dict().values()))
+
+    updated = db.execute(bulk_update(rows)).all()
+    db.commit()
+
+    return serializers.list_response(serializers.row_dicts(updated, schemas.TopicGet))
+
+
+# One UPDATE ... FROM (VALUES ...) for rows in TopicUpdate field order.
+# Typed columns give asyncpg typed parameters, the casts type the literal
+# NULLs psycopg2 sends.
+def bulk_update(rows: List[tuple]):
+    topic_table = models.Topic.__table__
+    fields = list(schemas.TopicUpdate.__fields__)
+    new_values = values(*[column(name, topic_table.c[name].type) for name in fields],
+                        name="new_values").data(rows)
+
+    return update(topic_table).where(
+        topic_table.c.id == new_values.c.id
+    ).values({
+        name: cast(new_values.c[name], topic_table.c[name].type) for name in fields if name != "id"
+    }).returning(*serializers.schema_columns(models.Topic, schemas.TopicGet))
+
+
+def check_batch_size(topics: list):
+    if len(topics) > settings.topic_batch_size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {settings.topic_batch_size} topics per request.")
+
+
 # Get topics for a particular lesson
 @router.get("/lesson/{id}", response_model=List[schemas.TopicGet])
-def get_topics(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+@database.session_route
+def get_topics(id: int, db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
 
-    topics = db.query(models.Topic).filter(
+    topics = db.query(*serializers.schema_columns(models.Topic, schemas.TopicGet)).filter(
         models.Topic.lesson_id == id).all()
 
-    return topics
+    return serializers.list_response(serializers.row_dicts(topics, schemas.TopicGet))
+
+
+# Get completed topics due for revision across all courses, oldest first.
+# Keyset paginated on (revision_date, id), served by ix_topics_due.
+@router.get("/due", response_model=schemas.TopicDuePage)
+@database.session_route
+def get_due_topics(before: Optional[datetime] = None, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=200), db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    if before == None:
+        before = datetime.now().astimezone()
+
+    query = db.query(models.Topic, models.Course.intensity).join(
+        models.Course, models.Course.id == models.Topic.course_id
+    ).filter(
+        models.Topic.user_id == current_user.id,
+        models.Topic.completed == True,
+        models.Topic.revised == False,
+        models.Topic.revision_date < before)
+
+    if cursor != None:
+        try:
+            after_date, after_id = decode_cursor(cursor)
+        except (ValueError, OverflowError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+        query = query.filter(tuple_(models.Topic.revision_date, models.Topic.id) > tuple_(
+            after_date, after_id))
+
+    rows = query.order_by(models.Topic.revision_date,
+                          models.Topic.id).limit(limit + 1).all()
+
+    topics = [schemas.TopicDue(intensity=intensity, **schemas.TopicGet.from_orm(topic).dict())
+              for topic, intensity in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1][0]
+        next_cursor = encode_cursor(last.revision_date, last.id)
+
+    return {"topics": topics, "next_cursor": next_cursor}
+
+
+# Cursors are "<revision date in epoch microseconds>_<topic id>"
+def encode_cursor(revision_date: datetime, id: int):
+    return f"{(revision_date - epoch) // timedelta(microseconds=1)}_{id}"
+
+
+def decode_cursor(cursor: str):
+    microseconds, id = cursor.split("_")
+    return epoch + timedelta(microseconds=int(microseconds)), int(id)
 
 
 # Get topic
 @router.get("/{id}", response_model=schemas.TopicGet)
-def get_topic(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+@database.session_route
+def get_topic(id: int, db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
     topic = db.query(models.Topic).filter(models.Topic.id == id).first()
 
     if not topic:
@@ -51,6 +204,7 @@ def get_topic(id: int, db: Session = Depends(database.get_db), current_user=Depe
 
 # Update topic
 @router.put("/", status_code=status.HTTP_200_OK)
+@database.session_route
 def update_topic(updated_topic: schemas.TopicUpdate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     topic_query = db.query(models.Topic).filter(
         models.Topic.id == updated_topic.id)
@@ -75,7 +229,7 @@ def update_topic(updated_topic: schemas.TopicUpdate, db: Session = Depends(datab
     # Increase topic stability, if it's a topic completion or revision
     if updated_topic.completed != topic.completed or updated_topic.revised != topic.revised:
         updated_topic.stability = utils.increase_topic_stability(
-            updated_topic.revision_count)
+            topic.stability)
 
     topic_query.update(updated_topic.dict())
     db.commit()
@@ -86,6 +240,7 @@ def update_topic(updated_topic: schemas.TopicUpdate, db: Session = Depends(datab
 
 # Delete topic
 @router.delete("/{id}")
+@database.session_route
 def delete_topic(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     topic_query = db.query(models.Topic).filter(models.Topic.id == id)
     topic = topic_query.first()
@@ -101,6 +256,8 @@ def delete_topic(id: int, db: Session = Depends(database.get_db), current_user=D
     topic_id = topic.id
 
     topic_query.delete(synchronize_session=False)
+    db.add(models.Tombstone(user_id=current_user.id,
+                            table_name="topics", row_id=topic_id))
     db.commit()
 
     return topic_id
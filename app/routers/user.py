@@ -1,14 +1,14 @@
-from pathlib import Path
 from datetime import datetime, date
-from typing import List
-from fastapi import APIRouter, status, HTTPException, Depends, Request, Header
-from starlette.responses import JSONResponse
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from typing import List, Optional
+from fastapi import APIRouter, status, HTTPException, Depends, Request, Header, Query
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 import razorpay
 
-from .. import database, models, schemas, utils, oauth2
-from ..config import mail, payment_settings
+from .. import database, models, schemas, utils, oauth2, hashing, outbox, instrumentation, metrics, serializers
+from ..config import payment_settings
 
 
 router = APIRouter(
@@ -17,29 +17,18 @@ router = APIRouter(
 )
 
 
-# FastAPI-Mail configuration
-conf = ConnectionConfig(
-    MAIL_USERNAME=mail.mail_username,
-    MAIL_PASSWORD=mail.mail_password,
-    MAIL_FROM=mail.mail_from,
-    MAIL_PORT=mail.mail_port,
-    MAIL_SERVER=mail.mail_server,
-    MAIL_FROM_NAME=mail.mail_from_name,
-    TEMPLATE_FOLDER=Path(__file__).parent / mail.template_folder,
-    MAIL_TLS=mail.mail_tls,
-    MAIL_SSL=mail.mail_ssl,
-    USE_CREDENTIALS=mail.use_credentials,
-    VALIDATE_CERTS=mail.validate_certs
-)
+# Razorpay client, shared so its HTTP session keeps connections alive
+razorpay_client = razorpay.Client(
+    auth=(payment_settings.razorpay_key_id, payment_settings.razorpay_key_secret))
+razorpay_client.set_app_details({"title": "Kengram", "version": "0.1-beta"})
 
 
-# Create user
-@router.post("/", status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+# Checks the invite under its row lock, add_user checks again before using it
+def check_new_user(db: Session, user: schemas.UserCreate):
 
     # Check if invite code exists in database
     invite = db.query(models.Invite).filter(
-        models.Invite.invite_code == user.invite_code).first()
+        models.Invite.invite_code == user.invite_code).with_for_update().first()
 
     if invite == None or invite.user_id != None:
         raise HTTPException(
@@ -64,14 +53,24 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail="Password should be of at least 8 characters, and must contain at least one character and one digit.")
 
-    # Hash password
-    hashed_password = utils.hash(user.password)
-    user.password = hashed_password
+    return invite
+
+
+# Give the connection back before the password is hashed, bcrypt is slow
+def check_new_user_and_release(db: Session, user: schemas.UserCreate):
+    check_new_user(db, user)
+    db.close()
+
+
+# The invite may have been used while the password was hashed. It stays
+# locked from the check until the user holding it commits.
+def add_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    invite = check_new_user(db, user)
 
     # Add user
-    new_user = models.User(**user.dict())
+    new_user = models.User(**{**user.dict(), "password": hashed_password})
     db.add(new_user)
-    db.commit()
+    db.flush()
     db.refresh(new_user)
 
     trial = True
@@ -80,6 +79,20 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
     db.commit()
     db.refresh(new_user)
 
+    return new_user
+
+
+# Create user
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+
+    await database.run_sync(db, check_new_user_and_release, user)
+
+    # Hash password
+    hashed_password = await hashing.hash(user.password)
+
+    new_user = await database.run_sync(db, add_user, user, hashed_password)
+
     # Create access token
     access_token = oauth2.create_access_token(data={"id": new_user.id})
 
@@ -88,7 +101,8 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
 
 # Get user
 @router.get("/", response_model=schemas.UserGet)
-def get_user(db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+@database.session_route
+def get_user(db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
     user = db.query(models.User).filter(
         models.User.id == current_user.id).first()
 
@@ -96,34 +110,20 @@ def get_user(db: Session = Depends(database.get_db), current_user=Depends(oauth2
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id:{id} does not exist.")
 
-    # Set inactive if expired
-    if utils.check_expiry(user.expiry_date):
-        user.active = False
-
-    # Get user's courses to calculate user metrics
+    # Get user's courses and their metrics to calculate user metrics
     courses = db.query(models.Course).filter(
         models.Course.user_id == current_user.id).all()
+    totals = metrics.topic_totals(
+        db, models.Topic.course_id, models.Topic.user_id == current_user.id)
+    courses = [schemas.CourseGet.from_orm(course).copy(update=utils.calculate_course_metrics(
+        course, *totals.get(course.id, (0, 0, 0)))) for course in courses]
 
-    # Calculate user goal status
-    user.goal_status = utils.calculate_user_goal_status(courses)
-
-    # Calculate user level
-    user.level = utils.calculate_user_level(courses)
-
-    # Calculate user strength
-    user.strength = utils.calculate_user_strength(courses)
-
-    # Calculate overall user progress
-    user.progress = utils.calculate_user_progress(courses)
-
-    db.commit()
-    db.refresh(user)
-
-    return user
+    return schemas.UserGet.from_orm(user).copy(update=utils.calculate_user_metrics(user, courses))
 
 
 # Update user data
 @router.put("/", status_code=status.HTTP_200_OK)
+@database.session_route
 def update_user(updated_user: schemas.UserUpdate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
     user_query = db.query(models.User).filter(
         models.User.id == current_user.id)
@@ -149,20 +149,15 @@ def update_user(updated_user: schemas.UserUpdate, db: Session = Depends(database
 
     user_query.update(updated_user.dict(), synchronize_session=False)
     db.commit()
+    oauth2.invalidate_user(current_user.id)
     db.refresh(user)
 
     return user
 
 
-# Update password
-@router.post("/password")
-def update_password(password: schemas.PasswordUpdate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    user = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not utils.verify(password.current_password, user.password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Wrong password. Please log out and reset your password, if you still face issues.")
-    user.password = utils.hash(password.new_password)
+def set_password(db: Session, id: int, hashed_password: str):
+    user = db.query(models.User).filter(models.User.id == id).first()
+    user.password = hashed_password
 
     db.commit()
     db.refresh(user)
@@ -170,10 +165,19 @@ def update_password(password: schemas.PasswordUpdate, db: Session = Depends(data
     return user
 
 
-# Generate and mail password reset code
-@router.post("/get-reset-code")
-async def get_reset_code(requester: schemas.PasswordResetCode, db: Session = Depends(database.get_db)) -> JSONResponse:
+# Update password
+@router.post("/password")
+async def update_password(password: schemas.PasswordUpdate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    user = await database.run_sync(db, oauth2.get_user_and_release, current_user.id)
+    if not await hashing.verify(password.current_password, user.password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Wrong password. Please log out and reset your password, if you still face issues.")
+    hashed_password = await hashing.hash(password.new_password)
 
+    return await database.run_sync(db, set_password, user.id, hashed_password)
+
+
+def set_reset_code(db: Session, requester: schemas.PasswordResetCode):
     user = db.query(models.User).filter(
         models.User.email == requester.email[0]).first()
 
@@ -186,23 +190,24 @@ async def get_reset_code(requester: schemas.PasswordResetCode, db: Session = Dep
         "name": user.name,
         "code": user.reset_code
     }
+
+    # Queue the mail in the same transaction as the code
+    outbox.enqueue(db, "Password Reset Initiated",
+                   requester.dict().get("email"), "password_reset.html", body)
     db.commit()
 
-    message = MessageSchema(
-        subject="Password Reset Initiated",
-        recipients=requester.dict().get("email"),
-        template_body=body
-    )
 
-    fm = FastMail(conf)
-    await fm.send_message(message, template_name="password_reset.html")
-    return JSONResponse(status_code=200, content={"message": "Password reset code sent to your registered email address."})
+# Generate and mail password reset code
+@router.post("/get-reset-code")
+async def get_reset_code(requester: schemas.PasswordResetCode, db: Session = Depends(database.get_db)) -> JSONResponse:
 
+    await database.run_sync(db, set_reset_code, requester)
+
+    outbox.wake()
+    return JSONResponse(status_code=200, content={"message": "Password reset code sent to your registered email address."})
 
-# Reset password with code
-@router.post("/reset-password")
-def reset_password(requester: schemas.PasswordReset, db: Session = Depends(database.get_db)) -> JSONResponse:
 
+def check_reset_code(db: Session, requester: schemas.PasswordReset):
     user = db.query(models.User).filter(
         models.User.email == requester.email_address).first()
 
@@ -214,18 +219,42 @@ def reset_password(requester: schemas.PasswordReset, db: Session = Depends(datab
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Wrong reset code. Access denied!")
 
-    user.password = utils.hash(requester.new_password)
+    # Give the connection back before the new password is hashed
+    db.close()
+    return user.id
 
-    db.commit()
+
+# Reset password with code
+@router.post("/reset-password")
+async def reset_password(requester: schemas.PasswordReset, db: Session = Depends(database.get_db)) -> JSONResponse:
+
+    id = await database.run_sync(db, check_reset_code, requester)
+
+    hashed_password = await hashing.hash(requester.new_password)
+    await database.run_sync(db, set_password, id, hashed_password)
 
     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Password reset successful."})
 
 
+def add_order(db: Session, order: dict, renewal: bool):
+    new_order = models.Order(id=order.get("id"), amount=order.get("amount"),
+                             currency=order.get("currency"), renewal=renewal)
+    db.add(new_order)
+    db.commit()
+
+
+# Create a Razorpay order off the event loop and persist it for verification
+async def create_order(db: Session, amount: int, currency: str, renewal: bool):
+    data = {"amount": amount, "currency": currency}
+    with instrumentation.timed("razorpay"):
+        order = await run_in_threadpool(razorpay_client.order.create, data=data)
+    await database.run_sync(db, add_order, order, renewal)
+    return order
+
+
 # Payment
 @router.post("/payment")
-def pay(local=Header(default=None)):
-    global payment
-
+async def pay(local=Header(default=None), db: Session = Depends(database.get_db)):
     currency = "INR"
     amount = 99900
 
@@ -233,21 +262,12 @@ def pay(local=Header(default=None)):
         currency = "USD"
         amount = 1800
 
-    client = razorpay.Client(
-        auth=(payment_settings.razorpay_key_id, payment_settings.razorpay_key_secret))
-
-    client.set_app_details({"title": "Kengram", "version": "0.1-beta"})
-
-    data = {"amount": amount, "currency": currency}
-    payment = client.order.create(data=data)
-    return payment
+    return await create_order(db, amount, currency, False)
 
 
 # Renewal Payment
 @router.post("/renewal-payment")
-def pay(local=Header(default=None)):
-    global payment
-
+async def pay_renewal(local=Header(default=None), db: Session = Depends(database.get_db)):
     currency = "INR"
     amount = 369900
 
@@ -255,14 +275,122 @@ def pay(local=Header(default=None)):
         currency = "USD"
         amount = 6600
 
-    client = razorpay.Client(
-        auth=(payment_settings.razorpay_key_id, payment_settings.razorpay_key_secret))
+    return await create_order(db, amount, currency, True)
 
-    client.set_app_details({"title": "Kengram", "version": "0.1-beta"})
 
-    data = {"amount": amount, "currency": currency}
-    payment = client.order.create(data=data)
-    return payment
+def get_invite_by_event(db: Session, event_id: str):
+    return db.query(models.Invite).filter(
+        models.Invite.event_id == event_id).first()
+
+
+def get_order(db: Session, order_id: str):
+    return db.query(models.Order).filter(models.Order.id == order_id).first()
+
+
+def mark_order_paid(db: Session, order_id: str, payment_id: str):
+    order = get_order(db, order_id)
+    order.status = "paid"
+    order.payment_id = payment_id
+
+
+# Renew membership of a paying user, returns False if the payer is not a user
+def renew_paid_membership(db: Session, entity: dict, event_id: str):
+    user_email = entity.get("email")
+    user = db.query(models.User).filter(
+        models.User.email == user_email).first()
+
+    if user == None:
+        return False
+
+    invite = db.query(models.Invite).filter(
+        models.Invite.email == user_email).first()
+
+    # Set user to active
+    user.active = True
+    trial = False
+    user.expiry_date = utils.calculate_expiry_date(
+        datetime.now(), trial)
+
+    # Set new event_id, date and invoice in invite
+    purchase_date = datetime.now()
+    invite.event_id = event_id
+    invite.invoice = "INV" + "_" + str(purchase_date.year) + str(
+        purchase_date.month) + str(purchase_date.day) + "_" + str(invite.id)
+    invite.creation_date = purchase_date
+
+    # Queue renewal mail in the same transaction
+    email_body = {
+        "invoice": invite.invoice,
+        "email": invite.email,
+        "phone": invite.phone,
+        "date": purchase_date.date(),
+    }
+    outbox.enqueue(db, "Kengram Membership Renewal",
+                   [invite.email], "renewal.html", email_body)
+
+    mark_order_paid(db, entity.get("order_id"), entity.get("id"))
+    db.commit()
+    oauth2.invalidate_user(user.id)
+
+    return True
+
+
+def add_invite(db: Session, invite_code: dict, subject: str):
+    new_invite = models.Invite(**invite_code)
+
+    db.add(new_invite)
+    db.flush()
+    if new_invite.invoice == None:
+        new_invite.invoice = "INV" + "_" + str(datetime.now().year) + str(
+            datetime.now().month) + str(datetime.now().day) + "_" + str(new_invite.id)
+
+    # Queue welcome mail with welcome_package in the same transaction
+    purchase_timestamp = datetime.fromisoformat(
+        str(new_invite.creation_date)).timestamp()
+    purchase_date = date.fromtimestamp(purchase_timestamp)
+    invite_body = {
+        "code": new_invite.invite_code,
+        "invoice": new_invite.invoice,
+        "email": new_invite.email,
+        "phone": new_invite.phone,
+        "date": purchase_date,
+    }
+    outbox.enqueue(db, subject, [new_invite.email],
+                   "welcome_package.html", invite_body)
+
+    db.commit()
+
+
+# Generate invite code for a new paying learner
+def create_paid_invite(db: Session, entity: dict, event_id: str):
+    invite_code = {
+        "invite_code": utils.generate_secret_code(9),
+        "phone": entity.get("contact"),
+        "email": entity.get("email"),
+        "event_id": event_id
+    }
+    mark_order_paid(db, entity.get("order_id"), entity.get("id"))
+    add_invite(db, invite_code, "Welcome to Mastery Learning Challenge")
+
+
+# Grant what a paid order was created for, once. The order row stays locked
+# until the grant commits, so the payment.captured and order.paid webhooks
+# of one order cannot both grant it. Returns None for an order already paid.
+# verify already loaded the order unlocked, populate_existing makes the
+# session take the status read under the lock instead of the loaded one.
+def fulfil_order(db: Session, entity: dict, event_id: str):
+    order = db.query(models.Order).filter(
+        models.Order.id == entity.get("order_id")
+    ).populate_existing().with_for_update().first()
+    if order.status == "paid":
+        return None
+
+    # A renewal paid by someone without an account still gets an invite
+    if order.renewal and renew_paid_membership(db, entity, event_id):
+        return "renewed"
+
+    create_paid_invite(db, entity, event_id)
+    return "invited"
 
 
 # Verify payment and send welcome package
@@ -271,8 +399,7 @@ async def verify(request: Request, x_razorpay_signature=Header(default=None),
                  x_razorpay_event_id=Header(default=None), db: Session = Depends(database.get_db)):
 
     # Handle duplicate webhook processing
-    invites = db.query(models.Invite).filter(
-        models.Invite.event_id == x_razorpay_event_id).first()
+    invites = await database.run_sync(db, get_invite_by_event, x_razorpay_event_id)
     if invites != None:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Duplicate webhook request is being ignored!"
@@ -280,24 +407,28 @@ async def verify(request: Request, x_razorpay_signature=Header(default=None),
 
     data = await request.json()
     body = await request.body()
-    client = razorpay.Client(
-        auth=(payment_settings.razorpay_key_id, payment_settings.razorpay_key_secret))
 
     # Verify webhook from Razorpay
     try:
-        client.utility.verify_webhook_signature(
+        razorpay_client.utility.verify_webhook_signature(
             body.decode("UTF-8"), x_razorpay_signature, payment_settings.razorpay_webhook_secret)
     except razorpay.errors.SignatureVerificationError:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
-    # Verify payment
-    if data == None or payment == None:
+    # Verify payment against the order stored when it was created
+    if data == None:
         raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT,
                             detail="Payment gateway timed out. Please try again.")
 
-    order_id = payment.get("id")
-    payment_id = data.get("payload").get("payment").get("entity").get("id")
+    entity = data.get("payload").get("payment").get("entity")
+    order = await database.run_sync(db, get_order, entity.get("order_id"))
+    if order == None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Order with id: {entity.get('order_id')} does not exist.")
+
+    order_id = order.id
+    payment_id = entity.get("id")
     generated_signature = utils.generate_signature(order_id, payment_id)
     params = {
         "razorpay_order_id": order_id,
@@ -306,117 +437,52 @@ async def verify(request: Request, x_razorpay_signature=Header(default=None),
     }
 
     try:
-        client.utility.verify_payment_signature(params)
+        razorpay_client.utility.verify_payment_signature(params)
     except razorpay.errors.SignatureVerificationError:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Unable to verify payment!")
 
-    # Check if registration or renewal
-    user_email = data.get("payload").get("payment").get("entity").get("email")
-    user = db.query(models.User).filter(
-        models.User.email == user_email).first()
+    # Renewal or registration, as chosen when the order was created
+    granted = await database.run_sync(
+        db, fulfil_order, entity, x_razorpay_event_id)
 
-    # Handle renewal
-    if user != None:
-        invite = db.query(models.Invite).filter(
-            models.Invite.email == user_email).first()
-
-        # Set user to active
-        user.active = True
-        trial = False
-        user.expiry_date = utils.calculate_expiry_date(
-            datetime.now(), trial)
-
-        # Set new event_id, date and invoice in invite
-        invite.event_id = x_razorpay_event_id
-        invite.invoice = "INV" + "_" + str(datetime.now().year) + str(
-            datetime.now().month) + str(datetime.now().day) + "_" + str(invite.id)
-        invite.creation_date = datetime.now().isoformat()
-
-        db.commit()
-        db.refresh(invite)
-        db.refresh(user)
-
-        # Send renewal mail
-        email = []
-        email.append(invite.email)
-        purchase_timestamp = datetime.fromisoformat(
-            str(invite.creation_date)).timestamp()
-        purchase_date = date.fromtimestamp(purchase_timestamp)
-        email_body = {
-            "invoice": invite.invoice,
-            "email": invite.email,
-            "phone": invite.phone,
-            "date": purchase_date,
-        }
-        message = MessageSchema(
-            subject="Kengram Membership Renewal",
-            recipients=email,
-            template_body=email_body
-        )
+    if granted == None:
+        return JSONResponse(status_code=200, content={"message": "Order already paid, duplicate webhook ignored."})
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="renewal.html")
-        return JSONResponse(status_code=200, content={"message": "Membership renewed successfully, details sent to registered email address."})
+    outbox.wake()
 
-    # Handle registration - Generate invite code
-    invite_code = {
-        "invite_code": utils.generate_secret_code(9),
-        "phone": data.get("payload").get("payment").get("entity").get("contact"),
-        "email": data.get("payload").get("payment").get("entity").get("email"),
-        "event_id": x_razorpay_event_id
-    }
-    new_invite = models.Invite(**invite_code)
-
-    db.add(new_invite)
-    db.commit()
-    db.refresh(new_invite)
-    new_invite.invoice = "INV" + "_" + str(datetime.now().year) + str(
-        datetime.now().month) + str(datetime.now().day) + "_" + str(new_invite.id)
-    db.commit()
+    # Handle renewal
+    if granted == "renewed":
+        return JSONResponse(status_code=200, content={"message": "Membership renewed successfully, details sent to registered email address."})
 
-    # Welcome mail with welcome_package
-    email = []
-    email.append(new_invite.email)
-    purchase_timestamp = datetime.fromisoformat(
-        str(new_invite.creation_date)).timestamp()
-    purchase_date = date.fromtimestamp(purchase_timestamp)
-    invite_body = {
-        "code": new_invite.invite_code,
-        "invoice": new_invite.invoice,
-        "email": new_invite.email,
-        "phone": new_invite.phone,
-        "date": purchase_date,
-    }
-    message = MessageSchema(
-        subject="Welcome to Mastery Learning Challenge",
-        recipients=email,
-        template_body=invite_body
-    )
-
-    fm = FastMail(conf)
-    await fm.send_message(message, template_name="welcome_package.html")
+    # Handle registration
     return JSONResponse(status_code=200, content={"message": "Welcome package successfully sent to registered email address."})
 
 
-# Sudo get all users
+# Sudo get all users, keyset paginated on id or streamed as NDJSON
 @router.get("/all", response_model=List[schemas.UserGet])
-def get_all_users(db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+async def get_all_users(active: Optional[bool] = None, expired: Optional[bool] = None, created_after: Optional[datetime] = None, after_id: Optional[int] = None, limit: int = Query(100, ge=1, le=1000), format: str = Query("json", regex="^(json|ndjson)$"), db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
-    users = db.query(models.User).all()
-    return users
+
+    statement = select(models.User)
+    if active != None:
+        statement = statement.where(models.User.active == active)
+    now = datetime.now().astimezone()
+    if expired == True:
+        statement = statement.where(models.User.expiry_date < now)
+    elif expired == False:
+        statement = statement.where(models.User.expiry_date >= now)
+
+    return await sudo_listing(db, statement, models.User, schemas.UserGet, created_after, after_id, limit, format)
 
 
 # Sudo create invite code
 @router.post("/create-invite")
-async def create_invite_code(invite: schemas.InviteCreate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+@database.session_route
+def create_invite_code(invite: schemas.InviteCreate, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
@@ -428,42 +494,17 @@ async def create_invite_code(invite: schemas.InviteCreate, db: Session = Depends
         "event_id": "SUDO",
         "invoice": "FREE"
     }
-    new_invite = models.Invite(**invite_code)
+    add_invite(db, invite_code, "Welcome to Kengram Insiders")
 
-    db.add(new_invite)
-    db.commit()
-    db.refresh(new_invite)
-
-    # Welcome mail with welcome_package
-    email = []
-    email.append(new_invite.email)
-    purchase_timestamp = datetime.fromisoformat(
-        str(new_invite.creation_date)).timestamp()
-    purchase_date = date.fromtimestamp(purchase_timestamp)
-    invite_body = {
-        "code": new_invite.invite_code,
-        "invoice": new_invite.invoice,
-        "email": new_invite.email,
-        "phone": new_invite.phone,
-        "date": purchase_date,
-    }
-    message = MessageSchema(
-        subject="Welcome to Kengram Insiders",
-        recipients=email,
-        template_body=invite_body
-    )
-
-    fm = FastMail(conf)
-    await fm.send_message(message, template_name="welcome_package.html")
+    outbox.wake()
     return JSONResponse(status_code=200, content={"message": "Welcome package successfully sent to registered email address."})
 
 
 # Sudo renew membership
 @router.post("/renew")
-async def renew_membership(learner: schemas.UserManage, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+@database.session_route
+def renew_membership(learner: schemas.UserManage, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
@@ -481,16 +522,16 @@ async def renew_membership(learner: schemas.UserManage, db: Session = Depends(da
         datetime.now(), trial)
 
     db.commit()
+    oauth2.invalidate_user(user.id)
     db.refresh(user)
 
     return user
 
 # Sudo delete user
 @router.delete("/{id}")
+@database.session_route
 def delete_user(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
@@ -505,76 +546,98 @@ def delete_user(id: int, db: Session = Depends(database.get_db), current_user=De
 
     user_query.delete(synchronize_session=False)
     db.commit()
+    oauth2.invalidate_user(user_id)
 
     return user_id
 
 
 # Sudo get user's courses
 @router.get("/courses/{id}", response_model=List[schemas.CourseGet])
-def get_user_courses(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+async def get_user_courses(id: int, created_after: Optional[datetime] = None, after_id: Optional[int] = None, limit: int = Query(100, ge=1, le=1000), format: str = Query("json", regex="^(json|ndjson)$"), db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
-    courses = db.query(models.Course).filter(
-        models.Course.user_id == id).all()
+    statement = select(models.Course).where(models.Course.user_id == id)
 
-    return courses
+    return await sudo_listing(db, statement, models.Course, schemas.CourseGet, created_after, after_id, limit, format)
 
 
 # Sudo get user's lessons
 @router.get("/lessons/{id}", response_model=List[schemas.LessonGet])
-def get_user_lessons(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+async def get_user_lessons(id: int, created_after: Optional[datetime] = None, after_id: Optional[int] = None, limit: int = Query(100, ge=1, le=1000), format: str = Query("json", regex="^(json|ndjson)$"), db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
-    lessons = db.query(models.Lesson).filter(
-        models.Lesson.user_id == id).all()
+    statement = select(models.Lesson).where(models.Lesson.user_id == id)
 
-    return lessons
+    return await sudo_listing(db, statement, models.Lesson, schemas.LessonGet, created_after, after_id, limit, format)
 
 
 # Sudo get user's topics
 @router.get("/topics/{id}", response_model=List[schemas.TopicGet])
-def get_user_topics(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+async def get_user_topics(id: int, created_after: Optional[datetime] = None, after_id: Optional[int] = None, limit: int = Query(100, ge=1, le=1000), format: str = Query("json", regex="^(json|ndjson)$"), db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
-    topics = db.query(models.Topic).filter(
-        models.Topic.user_id == id).all()
+    statement = select(models.Topic).where(models.Topic.user_id == id)
 
-    return topics
+    return await sudo_listing(db, statement, models.Topic, schemas.TopicGet, created_after, after_id, limit, format)
 
 
 # Sudo get user's bursts
 @router.get("/bursts/{id}", response_model=List[schemas.BurstGet])
-def get_user_bursts(id: int, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+async def get_user_bursts(id: int, created_after: Optional[datetime] = None, after_id: Optional[int] = None, limit: int = Query(100, ge=1, le=1000), format: str = Query("json", regex="^(json|ndjson)$"), db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
-    bursts = db.query(models.Burst).filter(
-        models.Burst.user_id == id).all()
+    statement = select(models.Burst).where(models.Burst.user_id == id)
+
+    return await sudo_listing(db, statement, models.Burst, schemas.BurstGet, created_after, after_id, limit, format)
+
+
+# Sudo listings share filters and paging. A JSON page holds up to limit
+# rows ordered by id, with the id to pass as after_id for the next page in
+# the X-Next-Cursor header. format=ndjson streams every matching row instead.
+async def sudo_listing(db, statement, model, schema, created_after, after_id, limit: int, format: str):
+    statement = listing_statement(
+        statement, model, schema, created_after, after_id)
+
+    if format == "ndjson":
+        return StreamingResponse(ndjson_lines(database.stream_rows(db, statement), schema),
+                                 media_type="application/x-ndjson")
+
+    rows = await database.run_sync(db, lambda session: session.execute(statement.limit(limit + 1)).all())
+    headers = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers = {"X-Next-Cursor": str(rows[-1].id)}
 
-    return bursts
+    return serializers.list_response(serializers.row_dicts(rows, schema), headers)
+
+
+def listing_statement(statement, model, schema, created_after, after_id):
+    if created_after != None:
+        statement = statement.where(model.creation_date > created_after)
+    if after_id != None:
+        statement = statement.where(model.id > after_id)
+    return statement.with_only_columns(
+        *serializers.schema_columns(model, schema)).order_by(model.id)
+
+
+async def ndjson_lines(rows, schema):
+    async for row in rows:
+        yield serializers.ndjson_line(serializers.row_dict(row, schema))
 
 
 # Sudo make/unmake superuser
 @router.post("/sudo")
+@database.session_route
 def sudo_user(learner: schemas.UserManage, db: Session = Depends(database.get_db), current_user=Depends(oauth2.get_current_user)):
-    sudo = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
-    if not sudo.superuser:
+    if not current_user.superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied!")
 
@@ -586,6 +649,7 @@ def sudo_user(learner: schemas.UserManage, db: Session = Depends(database.get_db
 
     user.superuser = not user.superuser
     db.commit()
+    oauth2.invalidate_user(user.id)
     db.refresh(user)
 
     return user
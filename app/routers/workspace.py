@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from .. import database, models, schemas, oauth2, utils, serializers
+
+
+router = APIRouter(
+    prefix="/api",
+    tags=["Workspace"]
+)
+
+section_schemas = {
+    "user": schemas.UserGet,
+    "courses": schemas.CourseGet,
+    "lessons": schemas.LessonGet,
+    "topics": schemas.TopicGet,
+}
+
+
+# Get the whole learner workspace (user, courses, lessons and topics with
+# their derived metrics) in four queries. fields= picks sections ("courses")
+# or single fields of a section ("courses.name"), everything by default.
+@router.get("/workspace", response_model=schemas.Workspace)
+@database.session_route
+def get_workspace(fields: Optional[str] = None, db: Session = Depends(database.get_read_db), current_user=Depends(oauth2.get_current_user)):
+    projection = parse_fields(fields)
+
+    user = db.query(models.User).filter(
+        models.User.id == current_user.id).first()
+
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"User with id:{current_user.id} does not exist.")
+
+    courses = db.query(models.Course).filter(
+        models.Course.user_id == current_user.id).order_by(models.Course.id).all()
+
+    # Topics are always read, their totals feed course and lesson metrics
+    topic_columns = [models.Topic.course_id, models.Topic.lesson_id,
+                     models.Topic.completed, models.Topic.stability]
+    if "topics" in projection:
+        topic_columns = serializers.schema_columns(
+            models.Topic, schemas.TopicGet)
+    topics = db.query(*topic_columns).filter(
+        models.Topic.user_id == current_user.id).order_by(models.Topic.id).all()
+
+    course_totals = {}
+    lesson_totals = {}
+    for topic in topics:
+        add_topic(course_totals, topic.course_id, topic)
+        add_topic(lesson_totals, topic.lesson_id, topic)
+
+    course_items = [{
+        **serializers.object_dict(course, schemas.CourseGet),
+        **utils.calculate_course_metrics(course, *course_totals.get(course.id, (0, 0, 0)))
+    } for course in courses]
+
+    workspace = {}
+    if "user" in projection:
+        workspace["user"] = project({
+            **serializers.object_dict(user, schemas.UserGet),
+            **utils.calculate_user_metrics(user, [SimpleNamespace(**course) for course in course_items])
+        }, projection["user"])
+
+    if "courses" in projection:
+        workspace["courses"] = [project(course, projection["courses"])
+                                for course in course_items]
+
+    if "lessons" in projection:
+        lessons = db.query(*serializers.schema_columns(models.Lesson, schemas.LessonGet)).filter(
+            models.Lesson.user_id == current_user.id).order_by(models.Lesson.id).all()
+        workspace["lessons"] = []
+        for lesson in serializers.row_dicts(lessons, schemas.LessonGet):
+            topic_count, completed_count, stability_sum = lesson_totals.get(
+                lesson["id"], (0, 0, 0))
+            lesson["progress"] = utils.calculate_progress(
+                completed_count, topic_count)
+            lesson["stability"] = utils.calculate_average_stability(
+                stability_sum, completed_count)
+            workspace["lessons"].append(project(lesson, projection["lessons"]))
+
+    if "topics" in projection:
+        workspace["topics"] = [project(topic, projection["topics"])
+                               for topic in serializers.row_dicts(topics, schemas.TopicGet)]
+
+    return serializers.list_response(workspace)
+
+
+# Section name -> list of fields, or None for every field of the section
+def parse_fields(fields: Optional[str]):
+    if fields == None:
+        return {section: None for section in section_schemas}
+
+    projection = {}
+    for entry in fields.split(","):
+        section, _, field = entry.strip().partition(".")
+        if section not in section_schemas or (field != "" and field not in section_schemas[section].__fields__):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Unknown field: {entry.strip()}")
+        if field == "":
+            projection[section] = None
+        elif projection.get(section, []) != None:
+            projection.setdefault(section, []).append(field)
+    return projection
+
+
+def project(item: dict, names):
+    if names == None:
+        return item
+    return {name: item[name] for name in names}
+
+
+# Accumulate topic count, completed count and completed stability sum
+def add_topic(totals: dict, key: int, topic):
+    topic_count, completed_count, stability_sum = totals.get(key, (0, 0, 0))
+    if topic.completed:
+        completed_count += 1
+        stability_sum += topic.stability or 0
+    totals[key] = (topic_count + 1, completed_count, stability_sum)
@@ -1,7 +1,7 @@
 from typing import Any, Dict, List, Optional
-from datetime import datetime
+from datetime import date, datetime
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, constr
 
 
 # User schemas
@@ -68,6 +68,17 @@ class UserLogin(BaseModel):
 class UserManage(BaseModel):
     id: int
 
+
+class CurrentUser(BaseModel):
+    id: int
+    superuser: Optional[bool]
+    active: Optional[bool]
+    expiry_date: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
 # Token schemas
 class TokenData(BaseModel):
     id: Optional[str]
@@ -185,6 +196,15 @@ class TopicGet(BaseModel):
         orm_mode = True
 
 
+class TopicDue(TopicGet):
+    intensity: str
+
+
+class TopicDuePage(BaseModel):
+    topics: List[TopicDue]
+    next_cursor: Optional[str]
+
+
 class TopicUpdate(BaseModel):
     id: int
     name: str
@@ -225,6 +245,53 @@ class BurstGet(BaseModel):
         orm_mode = True
 
 
+class BurstBatchItem(BurstCreate):
+    idempotency_key: constr(min_length=1, max_length=64)
+    creation_date: Optional[datetime]
+
+
+class BurstBatch(BaseModel):
+    bursts: List[BurstBatchItem]
+
+
+class BurstBatchResult(BaseModel):
+    idempotency_key: str
+    status: str
+    id: Optional[int]
+
+
+class BurstDay(BaseModel):
+    day: date
+    total_duration: int
+    burst_count: int
+
+    class Config:
+        orm_mode = True
+
+
+# Workspace schemas
+class Workspace(BaseModel):
+    user: Optional[UserGet]
+    courses: Optional[List[CourseGet]]
+    lessons: Optional[List[LessonGet]]
+    topics: Optional[List[TopicGet]]
+
+
+# Sync schemas
+class SyncDeleted(BaseModel):
+    table: str
+    id: int
+
+
+class SyncChanges(BaseModel):
+    cursor: str
+    courses: List[CourseGet]
+    lessons: List[LessonGet]
+    topics: List[TopicGet]
+    bursts: List[BurstGet]
+    deleted: List[SyncDeleted]
+
+
 # Invite schemas
 class InviteCreate(BaseModel):
     phone: str
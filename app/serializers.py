@@ -0,0 +1,33 @@
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+# Fast path for the hot list endpoints. Rows are turned into plain dicts
+# holding exactly the fields of the response schema and returned as an
+# ORJSONResponse, which FastAPI sends without response_model validation.
+# The schema stays on the route for the OpenAPI docs.
+
+
+def schema_columns(model, schema):
+    return [getattr(model, name) for name in schema.__fields__]
+
+
+def row_dict(row, schema):
+    return dict(zip(schema.__fields__, row))
+
+
+def row_dicts(rows, schema):
+    fields = list(schema.__fields__)
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def object_dict(obj, schema):
+    return {name: getattr(obj, name) for name in schema.__fields__}
+
+
+def list_response(items, headers: dict = None, status_code: int = 200):
+    return ORJSONResponse(items, status_code=status_code, headers=headers)
+
+
+def ndjson_line(item: dict):
+    return orjson.dumps(item) + b"\n"
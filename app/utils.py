@@ -80,13 +80,37 @@ def reset_course_streak(bursts: List):
     return False
 
 
+def check_streak_lapsed(last_burst_date):
+    day_in_seconds = 86400
+    if last_burst_date == None:
+        return False
+    if datetime.now().timestamp() - last_burst_date.timestamp() > day_in_seconds:
+        return True
+    return False
+
+
 def calculate_course_strength(bursts: List):
     duration = 0
     for burst in bursts:
         duration += burst.duration
+    return calculate_strength(duration)
+
+
+def calculate_strength(duration):
     return floor(duration / 60)
 
 
+def calculate_rolled_goal_reset_date(goal_reset_date):
+    week_in_seconds = 604800
+    now = datetime.now().timestamp()
+    if goal_reset_date == None or now <= goal_reset_date.timestamp():
+        return goal_reset_date
+    weeks_elapsed = floor((now - goal_reset_date.timestamp()) / week_in_seconds) + 1
+    new_date = datetime.fromtimestamp(
+        goal_reset_date.timestamp() + (weeks_elapsed * week_in_seconds), goal_reset_date.tzinfo)
+    return new_date
+
+
 def calculate_goal_reset_date(date):
     week_in_seconds = 604800
     new_date = datetime.fromtimestamp(date.timestamp() + week_in_seconds)
@@ -95,17 +119,27 @@ def calculate_goal_reset_date(date):
 
 def calculate_goal_status(bursts: List, course):
     goal_achieved = 0
-    goal_target = course.goal * 60
     week_in_seconds = 604800
     start_date = course.goal_reset_date.timestamp() - week_in_seconds
     end_date = course.goal_reset_date.timestamp()
     for burst in bursts:
         if burst.creation_date.timestamp() > start_date and burst.creation_date.timestamp() < end_date:
             goal_achieved += burst.duration
+    return calculate_goal_percentage(goal_achieved, course.goal)
+
+
+def calculate_goal_percentage(goal_achieved, goal):
+    goal_target = goal * 60
     goal_status = (goal_achieved / goal_target) * 100
     return goal_status
 
 
+def calculate_current_goal_status(goal_reset_date, current_week_duration, goal):
+    if goal_reset_date != None and datetime.now().timestamp() > goal_reset_date.timestamp():
+        return 0
+    return round(calculate_goal_percentage(current_week_duration, goal))
+
+
 def calculate_revision_date(revision_count, intensity):
     day_in_seconds = 86400
     date = datetime.now().timestamp()
@@ -161,28 +195,56 @@ def decrease_topic_stability(stability, revision_count, revision_date):
 
 
 def calculate_overall_progress(units):
-    if len(units) > 0:
-        completed_units = 0
-        for unit in units:
-            if unit.completed:
-                completed_units += 1
-        overall_progress = round((completed_units / len(units)) * 100)
+    completed_units = 0
+    for unit in units:
+        if unit.completed:
+            completed_units += 1
+    return calculate_progress(completed_units, len(units))
+
+
+def calculate_progress(completed_units, unit_count):
+    if unit_count > 0:
+        overall_progress = round((completed_units / unit_count) * 100)
         return overall_progress
     else:
         return 0
 
 
 def calculate_overall_stability(units):
-    if len(units) > 0:
-        stability_sum = 0
-        for unit in units:
-            stability_sum += unit.stability
-        overall_stability = round(stability_sum / len(units))
+    stability_sum = 0
+    for unit in units:
+        stability_sum += unit.stability
+    return calculate_average_stability(stability_sum, len(units))
+
+
+def calculate_average_stability(stability_sum, unit_count):
+    if unit_count > 0:
+        overall_stability = round(stability_sum / unit_count)
         return overall_stability
     else:
         return 0
 
 
+# Derived course values for a response, from the stored counters and the
+# topic totals of the course. Nothing is written back.
+def calculate_course_metrics(course, topic_count, completed_count, stability_sum):
+    progress = calculate_progress(completed_count, topic_count)
+    metrics = {
+        "streak": 0 if check_streak_lapsed(course.last_burst_at) else course.streak,
+        "strength": calculate_strength(course.total_duration),
+        "progress": progress,
+        "stability": calculate_average_stability(stability_sum, completed_count),
+        "goal_reset_date": calculate_rolled_goal_reset_date(course.goal_reset_date),
+        "goal_status": calculate_current_goal_status(
+            course.goal_reset_date, course.current_week_duration, course.goal),
+        "required_velocity": calculate_required_velocity(course.deadline, progress),
+    }
+    if progress < 100:
+        metrics["current_velocity"] = calculate_current_velocity(
+            course.creation_date, progress)
+    return metrics
+
+
 def calculate_current_velocity(creation_date, progress):
     week_in_seconds = 604800
     now = datetime.now().timestamp()
@@ -256,6 +318,19 @@ def calculate_user_progress(courses):
         return 0
 
 
+# Derived user values for a response, from courses carrying their derived
+# goal_status, strength and progress
+def calculate_user_metrics(user, courses):
+    return {
+        # Inactive if expired
+        "active": user.active and not check_expiry(user.expiry_date),
+        "goal_status": calculate_user_goal_status(courses),
+        "level": calculate_user_level(courses),
+        "strength": calculate_user_strength(courses),
+        "progress": calculate_user_progress(courses),
+    }
+
+
 def generate_secret_code(length: int):
     code = "".join(secrets.choice(string.ascii_letters + string.digits)
                    for i in range(length))
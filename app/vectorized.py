@@ -0,0 +1,169 @@
+import numpy as np
+
+
+# NumPy counterparts of the per-object calculations in utils, for
+# recomputing whole cohorts at once. Inputs are column arrays, timestamps as
+# epoch seconds, and every function takes one injected now instead of
+# calling datetime.now(). Integer results match their utils twins exactly:
+# np.rint rounds half to even like round() and float64 division is the same.
+
+day_in_seconds = 86400
+week_in_seconds = 604800
+intensities = ("Low", "High")
+
+
+def as_int(values):
+    return np.asarray(values).astype(np.int64)
+
+
+# utils.calculate_goal_percentage
+def goal_percentage(goal_achieved, goal):
+    goal_target = np.asarray(goal, dtype=np.float64) * 60
+    return (np.asarray(goal_achieved, dtype=np.float64) / goal_target) * 100
+
+
+# utils.calculate_goal_status for every course. Bursts are given as the
+# index of their course in the course columns.
+def goal_status(burst_course_index, burst_dates, burst_durations, goal_reset_dates, goals):
+    burst_course_index = np.asarray(burst_course_index)
+    burst_dates = np.asarray(burst_dates)
+    goal_reset_dates = np.asarray(goal_reset_dates)
+    end_dates = goal_reset_dates[burst_course_index]
+    start_dates = end_dates - week_in_seconds
+
+    in_window = (burst_dates > start_dates) & (burst_dates < end_dates)
+    goal_achieved = np.bincount(
+        burst_course_index[in_window],
+        weights=np.asarray(burst_durations, dtype=np.float64)[in_window],
+        minlength=len(goal_reset_dates))
+    return goal_percentage(goal_achieved, goals)
+
+
+# utils.check_streak_lapsed, last burst dates of NaN mean no burst yet
+def streak_lapsed(last_burst_dates, now: float):
+    last_burst_dates = np.asarray(last_burst_dates, dtype=np.float64)
+    return ~np.isnan(last_burst_dates) & (now - last_burst_dates > day_in_seconds)
+
+
+# utils.calculate_strength
+def strength(durations):
+    return as_int(np.floor(np.asarray(durations, dtype=np.float64) / 60))
+
+
+# utils.calculate_revision_date, as epoch seconds
+def revision_dates(revision_counts, course_intensities, now: float):
+    revision_counts = np.asarray(revision_counts, dtype=np.int64)
+    course_intensities = np.asarray(course_intensities)
+    days = np.select(
+        [revision_counts == 0,
+         course_intensities == intensities[0],
+         course_intensities == intensities[1]],
+        [1, revision_counts * 9, revision_counts * 3],
+        revision_counts * 6)
+    return now + (day_in_seconds * days)
+
+
+# utils.revision_due
+def revision_due(dates, now: float):
+    return now > np.asarray(dates)
+
+
+# utils.revision_overdue
+def revision_overdue(dates, now: float):
+    return now > np.asarray(dates) + day_in_seconds
+
+
+# utils.increase_topic_stability
+def increased_stability(stabilities):
+    new_stabilities = np.rint(np.asarray(stabilities, dtype=np.float64) + 20)
+    return as_int(np.minimum(new_stabilities, 100))
+
+
+# utils.decrease_topic_stability
+def decreased_stability(stabilities, revision_counts, last_revision_dates, now: float):
+    stabilities = np.asarray(stabilities, dtype=np.float64)
+    revision_counts = np.asarray(revision_counts, dtype=np.int64)
+    days_elapsed = np.floor(
+        (now - np.asarray(last_revision_dates, dtype=np.float64)) / day_in_seconds)
+
+    unrevised = revision_counts == 0
+    divisors = np.where(unrevised, 1, revision_counts)
+    new_stabilities = np.where(
+        unrevised,
+        stabilities - (10 * days_elapsed),
+        np.rint(stabilities - ((10 * days_elapsed) / divisors)))
+    return as_int(np.maximum(new_stabilities, 0))
+
+
+# utils.calculate_progress
+def progress(completed_counts, unit_counts):
+    completed_counts = np.asarray(completed_counts, dtype=np.float64)
+    unit_counts = np.asarray(unit_counts, dtype=np.float64)
+    divisors = np.where(unit_counts > 0, unit_counts, 1)
+    return as_int(np.where(unit_counts > 0, np.rint((completed_counts / divisors) * 100), 0))
+
+
+# utils.calculate_average_stability
+def average_stability(stability_sums, unit_counts):
+    stability_sums = np.asarray(stability_sums, dtype=np.float64)
+    unit_counts = np.asarray(unit_counts, dtype=np.float64)
+    divisors = np.where(unit_counts > 0, unit_counts, 1)
+    return as_int(np.where(unit_counts > 0, np.rint(stability_sums / divisors), 0))
+
+
+# utils.calculate_current_velocity
+def current_velocity(creation_dates, progresses, now: float):
+    weeks_elapsed = np.rint(
+        (now - np.asarray(creation_dates, dtype=np.float64)) / week_in_seconds)
+    divisors = np.where(weeks_elapsed > 0, weeks_elapsed, 1)
+    velocities = np.floor(np.asarray(progresses, dtype=np.float64) / divisors)
+    return as_int(np.where(weeks_elapsed > 0, velocities, 0))
+
+
+# utils.calculate_required_velocity
+def required_velocity(deadlines, progresses, now: float):
+    number_of_weeks = np.floor(
+        (np.asarray(deadlines, dtype=np.float64) - now) / week_in_seconds)
+    divisors = np.where(number_of_weeks < 1, 1, number_of_weeks)
+    velocities = np.rint(
+        (100 - np.asarray(progresses, dtype=np.float64)) / divisors)
+    return as_int(np.where(number_of_weeks < 1, 100, velocities))
+
+
+# utils.calculate_user_goal_status for every user. Courses are given as the
+# index of their user, bincount adds them in array order like the loop does.
+def user_goal_status(course_user_index, goals, goal_statuses, user_count: int):
+    goals = np.asarray(goals, dtype=np.float64)
+    goal_sums = np.bincount(course_user_index, weights=goals,
+                            minlength=user_count)
+    goal_status_sums = np.bincount(
+        course_user_index,
+        weights=(np.asarray(goal_statuses, dtype=np.float64) * goals) / 100,
+        minlength=user_count)
+
+    has_courses = np.bincount(course_user_index, minlength=user_count) > 0
+    divisors = np.where(has_courses, goal_sums, 1)
+    statuses = np.minimum(np.rint((goal_status_sums / divisors) * 100), 100)
+    return as_int(np.where(has_courses, statuses, 0))
+
+
+# utils.calculate_user_strength
+def user_strength(course_user_index, strengths, user_count: int):
+    return as_int(np.bincount(course_user_index, weights=np.asarray(
+        strengths, dtype=np.float64), minlength=user_count))
+
+
+# utils.calculate_user_level
+def user_level(course_user_index, strengths, user_count: int):
+    return as_int(np.floor(user_strength(course_user_index, strengths, user_count) / 10))
+
+
+# utils.calculate_user_progress
+def user_progress(course_user_index, progresses, user_count: int):
+    course_counts = np.bincount(course_user_index, minlength=user_count)
+    progress_sums = np.bincount(course_user_index, weights=np.asarray(
+        progresses, dtype=np.float64), minlength=user_count)
+
+    divisors = np.where(course_counts > 0, course_counts, 1)
+    progresses = np.minimum(np.floor(progress_sums / divisors), 100)
+    return as_int(np.where(course_counts > 0, progresses, 0))
@@ -0,0 +1,307 @@
+import asyncio
+import fcntl
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import orjson
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError, TimeoutError
+from starlette.concurrency import run_in_threadpool
+
+from . import metrics, models
+from .config import settings
+from .database import SessionLocal
+
+
+# Write-behind buffer for create_burst. Accepted bursts are appended to a
+# spool file of this worker and flushed every burst_flush_interval ms or
+# burst_flush_rows rows through metrics.insert_bursts, one multi-row INSERT
+# with the streak of each course replayed once per flush. Bursts carry a
+# server generated idempotency key, so replaying a spool after a crash never
+# inserts a burst twice. Spools of dead workers are replayed on startup.
+# A batch that keeps failing for any reason other than an unreachable
+# database is moved to a .dead file, so it cannot hold up newer bursts.
+# Appends are made durable by one fsync per group of concurrent requests,
+# run in the threadpool so the event loop never waits on the disk.
+
+logger = logging.getLogger(__name__)
+
+lock = threading.Lock()
+flush_lock = threading.Lock()
+lock_file = None
+lock_path = None
+spool = None
+spool_path = None
+flushing_path = None
+pending = 0
+flush_attempts = 0
+
+# Errors a batch is retried through for as long as they last
+unreachable = (OperationalError, InterfaceError, TimeoutError)
+
+wakeup = None
+worker_loop = None
+
+# Requests waiting for the next group fsync, and the task running them
+next_sync = None
+sync_task = None
+
+
+def spool_paths(name: str):
+    directory = Path(settings.burst_spool_dir)
+    return directory / f"{name}.lock", directory / f"{name}.spool", directory / f"{name}.flushing"
+
+
+# Append an accepted burst, returns False when the buffer is full or off.
+# Called on the event loop, returns once the burst is on disk.
+async def enqueue(values: dict):
+    global pending
+    line = orjson.dumps(values) + b"\n"
+    with lock:
+        if spool == None or pending >= settings.burst_queue_size:
+            return False
+        spool.write(line)
+        pending += 1
+        full = pending >= settings.burst_flush_rows
+
+    if full:
+        wake()
+    if settings.burst_spool_fsync:
+        await wait_for_fsync()
+    return True
+
+
+# Every request that appended before a group fsync starts is covered by it,
+# requests arriving meanwhile wait for the next one
+async def wait_for_fsync():
+    global next_sync, sync_task
+    if next_sync == None:
+        next_sync = asyncio.get_running_loop().create_future()
+    waiters = next_sync
+    if sync_task == None:
+        sync_task = asyncio.create_task(sync_spool())
+    await asyncio.shield(waiters)
+
+
+async def sync_spool():
+    global next_sync, sync_task
+    try:
+        while next_sync != None:
+            waiters, next_sync = next_sync, None
+            try:
+                await run_in_threadpool(fsync_files)
+                waiters.set_result(None)
+            except Exception as error:
+                waiters.set_exception(error)
+    finally:
+        sync_task = None
+
+
+# A rotated spool is synced through its new name, once inserted it is gone
+def fsync_files():
+    for path in (spool_path, flushing_path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def wake():
+    if wakeup != None:
+        worker_loop.call_soon_threadsafe(wakeup.set)
+
+
+def read_spool(path: Path):
+    values = []
+    for line in path.read_bytes().splitlines():
+        try:
+            value = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # Torn write of a crashed worker, that request never got its 202
+            continue
+        value["creation_date"] = datetime.fromisoformat(value["creation_date"])
+        values.append(value)
+    return values
+
+
+# Insert every burst of a spool file in one transaction, then drop the file
+def insert_spool(path: Path):
+    values = read_spool(path)
+    if len(values) > 0:
+        db = SessionLocal()
+        try:
+            try:
+                metrics.insert_bursts(db, values)
+                db.commit()
+            except IntegrityError:
+                # A lesson or course was deleted after its bursts were accepted
+                db.rollback()
+                lessons = set(db.query(models.Lesson.id, models.Lesson.course_id).filter(
+                    models.Lesson.id.in_({value["lesson_id"] for value in values})).all())
+                dropped = [value for value in values
+                           if (value["lesson_id"], value["course_id"]) not in lessons]
+                logger.warning("Dropped %d bursts of deleted lessons from %s: %s",
+                               len(dropped), path, orjson.dumps(dropped).decode())
+                values = [value for value in values
+                          if (value["lesson_id"], value["course_id"]) in lessons]
+                if len(values) > 0:
+                    metrics.insert_bursts(db, values)
+                db.commit()
+        finally:
+            db.close()
+
+    path.unlink()
+    return len(values)
+
+
+# Flush one batch, returns the number of bursts inserted. A batch that failed
+# to insert stays in the flushing file and is retried before anything newer.
+# Flushes never overlap, the worker and stop() share the flushing file.
+def flush():
+    with flush_lock:
+        return flush_batch()
+
+
+def flush_batch():
+    global spool, pending, flush_attempts
+    if not flushing_path.exists():
+        with lock:
+            if pending == 0:
+                return 0
+            spool.close()
+            os.replace(spool_path, flushing_path)
+            spool = open(spool_path, "ab", buffering=0)
+            pending = 0
+        flush_attempts = 0
+
+    try:
+        return insert_spool(flushing_path)
+    except unreachable:
+        raise
+    except Exception:
+        flush_attempts += 1
+        if flush_attempts < settings.burst_flush_max_attempts:
+            raise
+        logger.exception("Burst batch failed %d times", flush_attempts)
+        dead_letter(flushing_path)
+        flush_attempts = 0
+        return 0
+
+
+# Set a spool aside for inspection, nothing reads .dead files
+def dead_letter(path: Path):
+    dead_path = path.with_name(
+        f"{path.stem}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}.dead")
+    os.replace(path, dead_path)
+    logger.error("Moved %d bursts to %s", len(read_spool(dead_path)), dead_path)
+
+
+# Replay the spools of workers that died without flushing
+def recover():
+    for orphan_lock_path in Path(settings.burst_spool_dir).glob("bursts-*.lock"):
+        if orphan_lock_path == lock_path:
+            continue
+        try:
+            orphan_lock = open(orphan_lock_path, "rb")
+        except FileNotFoundError:
+            continue
+
+        with orphan_lock:
+            try:
+                fcntl.flock(orphan_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+
+            # Another worker may have recovered it while we waited
+            if not orphan_lock_path.exists():
+                continue
+
+            _, orphan_spool_path, orphan_flushing_path = spool_paths(
+                orphan_lock_path.stem)
+            recovered = True
+            for path in (orphan_flushing_path, orphan_spool_path):
+                if not path.exists():
+                    continue
+                try:
+                    logger.info("Recovered %d bursts from %s",
+                                insert_spool(path), path)
+                except unreachable:
+                    # Left for the next worker that starts
+                    logger.exception("Failed to recover %s", path)
+                    recovered = False
+                    break
+                except Exception:
+                    logger.exception("Failed to recover %s", path)
+                    dead_letter(path)
+            if recovered:
+                orphan_lock_path.unlink()
+
+
+def start():
+    global lock_file, lock_path, spool, spool_path, flushing_path, pending
+    Path(settings.burst_spool_dir).mkdir(parents=True, exist_ok=True)
+    lock_path, spool_path, flushing_path = spool_paths(f"bursts-{os.getpid()}")
+
+    # Held for the life of the worker, a free lock marks an orphaned spool
+    lock_file = open(lock_path, "wb")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    recover()
+
+    # Leftovers of a dead worker that had the same pid are flushed as ours
+    if spool_path.exists():
+        pending = len(read_spool(spool_path))
+    spool = open(spool_path, "ab", buffering=0)
+
+
+async def run_worker():
+    global wakeup, worker_loop
+    worker_loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    while True:
+        try:
+            await asyncio.wait_for(wakeup.wait(), settings.burst_flush_interval / 1000)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+
+        try:
+            flush_start = perf_counter()
+            flushed = await run_in_threadpool(flush)
+            if flushed > 0:
+                logger.info("Flushed %d bursts in %.1f ms", flushed,
+                            (perf_counter() - flush_start) * 1000)
+        except Exception:
+            logger.exception("Burst write-behind failed to flush")
+
+
+# Stop accepting, flush what is left and release the spool. Whatever fails to
+# flush stays on disk for the next worker to recover.
+async def stop(worker):
+    global lock_file, spool
+    worker.cancel()
+    try:
+        await worker
+    except asyncio.CancelledError:
+        pass
+
+    try:
+        while flushing_path.exists() or pending > 0:
+            await run_in_threadpool(flush)
+    except Exception:
+        logger.exception("Burst write-behind failed to flush on shutdown")
+
+    with lock:
+        spool.close()
+        spool = None
+        if not flushing_path.exists() and spool_path.stat().st_size == 0:
+            spool_path.unlink()
+            lock_path.unlink()
+        lock_file.close()
+        lock_file = None
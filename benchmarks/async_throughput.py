@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+
+from .common import (authorization, client, create_courses, create_user, database,
+                     load, percentile, reset_database, use_driver)
+
+
+# Serve the same dashboard request through the sync and the async driver.
+# Usage: python -m benchmarks.async_throughput [--requests N] [--concurrency N]
+
+
+def seed(course_count: int):
+    reset_database()
+    db = database.SessionLocal()
+    try:
+        user = create_user(db, "bench")
+        create_courses(db, user, course_count, topics_per_course=20)
+        return authorization(user)
+    finally:
+        db.close()
+
+
+async def measure(headers: dict, request_count: int, concurrency: int):
+    results = {}
+    async with client() as bench_client:
+        for name in ("sync", "async"):
+            use_driver(name)
+
+            # Warm the user cache, then the pools, before timing
+            await load(bench_client, "GET", "/api/courses/", 1, 1, headers=headers)
+            await load(bench_client, "GET", "/api/courses/", concurrency, concurrency, headers=headers)
+            results[name] = await load(
+                bench_client, "GET", "/api/courses/", request_count, concurrency, headers=headers)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare GET /api/courses/ throughput of the sync and async drivers.")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="Number of timed requests per driver.")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="Requests in flight at once.")
+    parser.add_argument("--courses", type=int, default=10,
+                        help="Courses of the benchmark user.")
+    args = parser.parse_args()
+
+    headers = seed(args.courses)
+    results = asyncio.run(measure(headers, args.requests, args.concurrency))
+    for name, (latencies, failures, elapsed) in results.items():
+        print(f"{name}: {len(latencies) / elapsed:.0f} req/s, "
+              f"p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, {failures} failed")
+
+
+if __name__ == "__main__":
+    main()
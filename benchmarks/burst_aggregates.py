@@ -0,0 +1,106 @@
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, cast, func, insert, text
+
+from app import metrics, models
+from app.routers import burst
+
+from .common import best_of, create_courses, create_user, database, reset_database
+
+
+# Time the burst aggregates of a long-time user: interruptions counted by
+# GROUP BY against loading every burst, and the heatmap read from
+# burst_daily against summing the raw bursts per day.
+# Usage: python -m benchmarks.burst_aggregates [--bursts N]
+
+interruptions = (None, "Self", "Digital", "People")
+
+
+def seed(db, burst_count: int):
+    reset_database()
+    user = create_user(db, "bench")
+    _, lessons = create_courses(db, user, 5)
+
+    now = datetime.now().astimezone()
+    rng = random.Random(0)
+    rows = []
+    for number in range(burst_count):
+        lesson = rng.choice(lessons)
+        interruption = rng.choice(interruptions)
+        rows.append({"course_id": lesson.course_id, "lesson_id": lesson.id, "user_id": user.id,
+                     "duration": rng.randint(60, 3600), "interrupted": interruption != None,
+                     "interruption": interruption, "idempotency_key": f"bench-{number}",
+                     "creation_date": now - timedelta(seconds=rng.randint(0, 3 * 365 * 86400))})
+
+    for start in range(0, burst_count, 10000):
+        db.execute(insert(models.Burst.__table__), rows[start:start + 10000])
+    metrics.rebuild_burst_daily(db, user.id, user.id + 1)
+    db.commit()
+    db.execute(text("ANALYZE"))
+    return user
+
+
+# get_interruptions before it grouped in SQL
+def orm_interruptions(db, user):
+    bursts = db.query(models.Burst).filter(
+        models.Burst.user_id == user.id).all()
+
+    counts = {"Self": 0, "Digital": 0, "People": 0, "Uninterrupted": 0}
+    for row in bursts:
+        if not row.interrupted:
+            counts["Uninterrupted"] += 1
+        elif row.interruption in counts:
+            counts[row.interruption] += 1
+    return [{"name": name, "value": value} for name, value in counts.items()]
+
+
+def grouped_interruptions(db, user):
+    return burst.get_interruptions.__wrapped__(
+        course_id=None, since=None, until=None, db=db, current_user=user)
+
+
+# The heatmap without the rollup, summed from every burst of the window
+def raw_heatmap(db, user, days: int = 365):
+    day = cast(models.Burst.creation_date, Date)
+    return db.query(
+        day, func.sum(models.Burst.duration), func.count()
+    ).filter(
+        models.Burst.user_id == user.id,
+        day > date.today() - timedelta(days=days)
+    ).group_by(day).order_by(day).all()
+
+
+def rollup_heatmap(db, user):
+    return burst.get_heatmap.__wrapped__(days=365, course_id=None, db=db, current_user=user)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the burst aggregates of one user over many bursts.")
+    parser.add_argument("--bursts", type=int, default=100000,
+                        help="Number of bursts of the benchmark user.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs per variant, the fastest is reported.")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        user = seed(db, args.bursts)
+        assert orm_interruptions(db, user) == grouped_interruptions(db, user)
+        assert [tuple(row) for row in raw_heatmap(db, user)] == [
+            tuple(row) for row in rollup_heatmap(db, user)]
+
+        for name, before, after in (("interruptions", orm_interruptions, grouped_interruptions),
+                                    ("heatmap", raw_heatmap, rollup_heatmap)):
+            before_time = best_of(args.repeat, before, db, user)
+            after_time = best_of(args.repeat, after, db, user)
+            print(f"{name}, {args.bursts} bursts: {before.__name__} {before_time * 1000:.1f} ms, "
+                  f"{after.__name__} {after_time * 1000:.1f} ms")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from app.config import settings
+
+
+# Benchmarks run against <DATABASE_NAME>_bench on the configured server, the
+# database has to exist. Both engines are created so a run can compare the
+# sync and async drivers in one process. Slow requests are expected under
+# load and are not logged.
+settings.database_name = f"{settings.database_name}_bench"
+settings.database_async = True
+settings.slow_request_ms = 10 ** 9
+
+from app import database, models, oauth2  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+drivers = {
+    "sync": (database.get_sync_db, database.get_sync_read_db),
+    "async": (database.get_async_db, database.get_async_read_db),
+}
+
+
+def use_driver(name: str):
+    get_db, get_read_db = drivers[name]
+    app.dependency_overrides[database.get_db] = get_db
+    app.dependency_overrides[database.get_read_db] = get_read_db
+
+
+def reset_database():
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    oauth2.user_cache.clear()
+
+
+def create_user(db, username: str, password: str = "not a hash"):
+    user = models.User(name=username, username=username, email=f"{username}@kengram.com",
+                       password=password, invite_code=username)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def create_courses(db, user, count: int, topics_per_course: int = 0):
+    now = datetime.now().astimezone()
+    courses = [models.Course(name=f"Course {number}", intensity="Medium", goal=10, user_id=user.id,
+                             deadline=now + timedelta(weeks=10), goal_reset_date=now + timedelta(weeks=1))
+               for number in range(count)]
+    db.add_all(courses)
+    db.commit()
+
+    lessons = [models.Lesson(name="Lesson", course_id=course.id, user_id=user.id)
+               for course in courses]
+    db.add_all(lessons)
+    db.commit()
+
+    db.add_all([models.Topic(name=f"Topic {number}", lesson_id=lesson.id, course_id=lesson.course_id,
+                             user_id=user.id) for lesson in lessons for number in range(topics_per_course)])
+    db.commit()
+    return courses, lessons
+
+
+def authorization(user):
+    token = oauth2.create_access_token(data={"id": user.id})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def client():
+    return httpx.AsyncClient(app=app, base_url="http://bench", timeout=None)
+
+
+# Send count requests with at most concurrency in flight. Returns the
+# latencies of the successful requests in seconds, the number of failed
+# ones and the elapsed wall time.
+async def load(client, method: str, url: str, count: int, concurrency: int, **kwargs):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def send():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                response.raise_for_status()
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send() for _ in range(count)])
+    return latencies, failures, time.perf_counter() - start
+
+
+def percentile(values, fraction: float):
+    if len(values) == 0:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def best_of(repeat: int, function, *args, **kwargs):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
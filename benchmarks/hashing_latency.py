@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+
+from starlette.concurrency import run_in_threadpool
+
+from app import hashing, utils
+
+from .common import (authorization, client, create_courses, create_user, database,
+                     load, percentile, reset_database, use_driver)
+
+
+# Latency of an unrelated endpoint while a login flood hashes passwords,
+# with bcrypt in the request threadpool as before and in the hashing pool.
+# Usage: python -m benchmarks.hashing_latency [--logins N] [--concurrency N]
+
+password = "benchmark password 1"
+
+
+def seed():
+    reset_database()
+    db = database.SessionLocal()
+    try:
+        user = create_user(db, "bench", utils.hash(password))
+        create_courses(db, user, 10, topics_per_course=20)
+        return authorization(user)
+    finally:
+        db.close()
+
+
+# How login hashed before the pool, in the threadpool of the sync route
+async def threadpool_run(fn, *args):
+    return await run_in_threadpool(fn, *args)
+
+
+async def flood(bench_client, headers: dict, login_count: int, concurrency: int):
+    login = asyncio.create_task(load(
+        bench_client, "POST", "/api/login", login_count, concurrency,
+        data={"username": "bench", "password": password}))
+
+    latencies = []
+    while not login.done():
+        probe, _, _ = await load(bench_client, "GET", "/api/courses/", 4, 4, headers=headers)
+        latencies += probe
+    _, failures, elapsed = await login
+    return latencies, failures, elapsed
+
+
+async def measure(headers: dict, login_count: int, concurrency: int):
+    results = {}
+    async with client() as bench_client:
+        await load(bench_client, "GET", "/api/courses/", 1, 1, headers=headers)
+        latencies, _, elapsed = await load(
+            bench_client, "GET", "/api/courses/", 200, 4, headers=headers)
+        results["idle"] = (latencies, 0, elapsed)
+
+        run = hashing.run
+        hashing.run = threadpool_run
+        try:
+            results["threadpool"] = await flood(bench_client, headers, login_count, concurrency)
+        finally:
+            hashing.run = run
+        results["hashing pool"] = await flood(bench_client, headers, login_count, concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure GET /api/courses/ latency during a login flood.")
+    parser.add_argument("--logins", type=int, default=200,
+                        help="Number of logins in the flood.")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="Logins in flight at once.")
+    args = parser.parse_args()
+
+    headers = seed()
+    use_driver("async")
+    try:
+        results = asyncio.run(measure(headers, args.logins, args.concurrency))
+    finally:
+        hashing.shutdown()
+
+    for name, (latencies, failures, elapsed) in results.items():
+        line = (f"{name}: courses p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+                f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+        if name != "idle":
+            line += f", {args.logins} logins in {elapsed:.1f}s, {failures} refused"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
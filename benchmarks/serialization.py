@@ -0,0 +1,56 @@
+import argparse
+from datetime import datetime, timedelta
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+from app import models, schemas, serializers
+
+from .common import best_of
+
+
+# Serialization cost of a topic list response: pydantic orm_mode validation
+# and JSONResponse as before, row dicts and ORJSONResponse now.
+# Usage: python -m benchmarks.serialization [--rows N]
+
+
+def topic_rows(row_count: int):
+    now = datetime.now().astimezone()
+    return [(number, f"Topic {number}", "Notes" if number % 3 == 0 else None, number % 2 == 0, number % 4 == 0,
+             number % 5, now + timedelta(days=number % 30), number % 101, number // 20, number // 200, 1, now)
+            for number in range(row_count)]
+
+
+def pydantic_response(topics):
+    return JSONResponse(jsonable_encoder(parse_obj_as(List[schemas.TopicGet], topics)))
+
+
+def orjson_response(rows):
+    return serializers.list_response(serializers.row_dicts(rows, schemas.TopicGet))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the serialization of a topic list before and after the fast path.")
+    parser.add_argument("--rows", type=int, default=10000,
+                        help="Number of topics in the list.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs per variant, the fastest is reported.")
+    args = parser.parse_args()
+
+    rows = topic_rows(args.rows)
+    topics = [models.Topic(**serializers.row_dict(row, schemas.TopicGet)) for row in rows]
+    assert orjson.loads(pydantic_response(topics).body) == orjson.loads(
+        orjson_response(rows).body)
+
+    before = best_of(args.repeat, pydantic_response, topics)
+    after = best_of(args.repeat, orjson_response, rows)
+    print(f"{args.rows} topics: pydantic and JSONResponse {before * 1000:.1f} ms, "
+          f"row dicts and ORJSONResponse {after * 1000:.1f} ms ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
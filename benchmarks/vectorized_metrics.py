@@ -0,0 +1,74 @@
+import argparse
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app import utils, vectorized
+
+
+# Time the per-topic utils loop against its vectorized counterpart on a
+# synthetic cohort. Usage: python -m benchmarks.vectorized_metrics [--topics N]
+
+
+def synthetic_topics(topic_count: int, now: float):
+    rng = np.random.default_rng(0)
+    return {
+        "stabilities": rng.integers(0, 101, topic_count),
+        "revision_counts": rng.integers(0, 20, topic_count),
+        "revision_dates": now - rng.integers(0, 60 * vectorized.day_in_seconds, topic_count),
+        "intensities": rng.choice(["Low", "Medium", "High"], topic_count),
+    }
+
+
+def loop_metrics(topics: dict):
+    revision_dates = [datetime.fromtimestamp(date, timezone.utc)
+                      for date in topics["revision_dates"].tolist()]
+    stabilities = [utils.decrease_topic_stability(stability, revision_count, revision_date)
+                   for stability, revision_count, revision_date in zip(
+                       topics["stabilities"].tolist(), topics["revision_counts"].tolist(), revision_dates)]
+    due = [utils.revision_due(revision_date) for revision_date in revision_dates]
+    next_dates = [utils.calculate_revision_date(revision_count, intensity)
+                  for revision_count, intensity in zip(
+                      topics["revision_counts"].tolist(), topics["intensities"].tolist())]
+    return stabilities, due, next_dates
+
+
+def vectorized_metrics(topics: dict, now: float):
+    stabilities = vectorized.decreased_stability(
+        topics["stabilities"], topics["revision_counts"], topics["revision_dates"], now)
+    due = vectorized.revision_due(topics["revision_dates"], now)
+    next_dates = vectorized.revision_dates(
+        topics["revision_counts"], topics["intensities"], now)
+    return stabilities, due, next_dates
+
+
+def best_of(repeat: int, function, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the utils topic metrics with their vectorized counterparts.")
+    parser.add_argument("--topics", type=int, default=1000000,
+                        help="Number of synthetic topics.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per variant, the fastest is reported.")
+    args = parser.parse_args()
+
+    now = datetime.now().timestamp()
+    topics = synthetic_topics(args.topics, now)
+
+    loop = best_of(args.repeat, loop_metrics, topics)
+    numpy = best_of(args.repeat, vectorized_metrics, topics, now)
+    print(f"{args.topics} topics: utils loop {loop:.3f}s, "
+          f"vectorized {numpy:.3f}s ({loop / numpy:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
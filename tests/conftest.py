@@ -0,0 +1,158 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+
+
+# Tests run against <DATABASE_NAME>_test on the configured server, the
+# database has to exist. Every test starts from freshly created tables.
+settings.database_name = f"{settings.database_name}_test"
+
+from app import database, models, oauth2  # noqa: E402
+from app.instrumentation import instrument_engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+# asyncpg connections belong to one event loop and every TestClient request
+# runs on its own, so the async sessions of the tests are not pooled
+async_engine = create_async_engine(
+    database.async_url(database.DATABASE_URL), poolclass=NullPool)
+instrument_engine(async_engine.sync_engine)
+AsyncTestingSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine, class_=AsyncSession)
+
+
+async def get_async_testing_db():
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
+
+async def get_async_testing_read_db():
+    async with AsyncTestingSessionLocal() as db:
+        yield database.read_only_on_begin(db)
+
+
+drivers = {
+    "sync": (database.get_sync_db, database.get_sync_read_db),
+    "async": (get_async_testing_db, get_async_testing_read_db),
+}
+
+
+@pytest.fixture
+def session():
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    oauth2.user_cache.clear()
+
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Every API test runs once with psycopg2 sessions and once with asyncpg ones
+@pytest.fixture(params=list(drivers))
+def client(request, session):
+    get_db, get_read_db = drivers[request.param]
+    app.dependency_overrides[database.get_db] = get_db
+    app.dependency_overrides[database.get_read_db] = get_read_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+# Statements sent by any engine while the test runs
+@pytest.fixture
+def queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = [database.engine, async_engine.sync_engine]
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+# Connections checked out of any pool while the test runs
+@pytest.fixture
+def connections():
+    counts = {"open": 0, "most": 0}
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        counts["open"] += 1
+        counts["most"] = max(counts["most"], counts["open"])
+
+    def checkin(dbapi_connection, connection_record):
+        counts["open"] -= 1
+
+    pools = [database.engine.pool, async_engine.sync_engine.pool]
+    for pool in pools:
+        event.listen(pool, "checkout", checkout)
+        event.listen(pool, "checkin", checkin)
+    yield counts
+    for pool in pools:
+        event.remove(pool, "checkout", checkout)
+        event.remove(pool, "checkin", checkin)
+
+
+def create_user(db, username: str):
+    user = models.User(name=username, username=username, email=f"{username}@kengram.com",
+                       password="not a hash", invite_code=username)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@pytest.fixture
+def test_user(session):
+    return create_user(session, "test")
+
+
+@pytest.fixture
+def other_user(session):
+    return create_user(session, "other")
+
+
+@pytest.fixture
+def authorized_client(client, test_user):
+    token = oauth2.create_access_token(data={"id": test_user.id})
+    client.headers = {**client.headers, "Authorization": f"Bearer {token}"}
+    return client
+
+
+def create_course(db, user, name: str = "Course", intensity: str = "Medium"):
+    now = datetime.now().astimezone()
+    course = models.Course(name=name, intensity=intensity, goal=10, user_id=user.id,
+                           deadline=now + timedelta(weeks=10), goal_reset_date=now + timedelta(weeks=1))
+    db.add(course)
+    db.commit()
+    db.refresh(course)
+    return course
+
+
+def create_lesson(db, course, name: str = "Lesson"):
+    lesson = models.Lesson(name=name, course_id=course.id,
+                           user_id=course.user_id)
+    db.add(lesson)
+    db.commit()
+    db.refresh(lesson)
+    return lesson
+
+
+def create_topics(db, lesson, count: int, **values):
+    topics = [models.Topic(name=f"Topic {number}", lesson_id=lesson.id, course_id=lesson.course_id,
+                           user_id=lesson.user_id, **values) for number in range(count)]
+    db.add_all(topics)
+    db.commit()
+    return topics
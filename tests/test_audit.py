@@ -0,0 +1,8 @@
+from app import audit, database
+
+
+# Every statement of the audit list compiles and is accepted by EXPLAIN
+def test_router_queries_explain(session):
+    with database.engine.connect() as connection:
+        for name, query in audit.router_queries(session, 1).items():
+            assert "Node Type" in audit.explain(connection, query), name
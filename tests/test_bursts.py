@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from app import metrics, models
+
+from .conftest import create_course, create_lesson
+
+
+def burst(lesson, key: str, duration: int = 600, **values):
+    return {"course_id": lesson.course_id, "lesson_id": lesson.id, "duration": duration, "interrupted": False,
+            "interruption": None, "idempotency_key": key, **values}
+
+
+def course_counters(db, course_id: int):
+    db.expire_all()
+    course = db.get(models.Course, course_id)
+    return course.total_duration, course.current_week_duration, course.last_burst_at
+
+
+def test_create_bursts_increments_counters(authorized_client, session, test_user):
+    lesson = create_lesson(session, create_course(session, test_user))
+
+    response = authorized_client.post("/api/bursts/", json={
+        "course_id": lesson.course_id, "lesson_id": lesson.id, "duration": 300, "interrupted": False})
+    assert response.status_code == 201
+
+    batch = {"bursts": [burst(lesson, "a", 600), burst(lesson, "b", 900)]}
+    response = authorized_client.post("/api/bursts/batch", json=batch)
+    assert [result["status"] for result in response.json()] == [
+        "created", "created"]
+
+    total_duration, current_week_duration, last_burst_at = course_counters(
+        session, lesson.course_id)
+    assert total_duration == current_week_duration == 1800
+    assert last_burst_at != None
+
+    # A retried batch is recognised and counted once
+    response = authorized_client.post("/api/bursts/batch", json=batch)
+    assert [result["status"] for result in response.json()] == [
+        "duplicate", "duplicate"]
+    assert course_counters(session, lesson.course_id)[:2] == (1800, 1800)
+
+
+# The increments match counters recomputed from the whole bursts table
+def test_create_bursts_counters_match_a_recompute(authorized_client, session, test_user):
+    now = datetime.now().astimezone()
+    course = create_course(session, test_user)
+    course.goal_reset_date = now + timedelta(days=3)
+    session.commit()
+    lesson = create_lesson(session, course)
+    other_lesson = create_lesson(session, create_course(session, test_user))
+
+    response = authorized_client.post("/api/bursts/batch", json={"bursts": [
+        burst(lesson, "old", 1200, creation_date=(now - timedelta(weeks=3)).isoformat()),
+        burst(lesson, "recent", 600, creation_date=(now - timedelta(hours=2)).isoformat()),
+        burst(other_lesson, "other", 300)]})
+    assert response.status_code == 200
+
+    incremented = [course_counters(session, course_id)
+                   for course_id in (lesson.course_id, other_lesson.course_id)]
+    assert incremented[0][:2] == (1800, 600)
+
+    metrics.refresh_course_counters(session)
+    session.commit()
+    assert incremented == [course_counters(session, course_id)
+                           for course_id in (lesson.course_id, other_lesson.course_id)]
+
+
+def test_create_bursts_rejects_foreign_lessons(authorized_client, session, test_user, other_user):
+    lesson = create_lesson(session, create_course(session, test_user))
+    foreign_lesson = create_lesson(session, create_course(session, other_user))
+
+    response = authorized_client.post("/api/bursts/batch", json={"bursts": [
+        burst(lesson, "mine"), burst(foreign_lesson, "theirs")]})
+    assert [result["status"] for result in response.json()] == [
+        "created", "rejected"]
+    assert course_counters(session, foreign_lesson.course_id)[0] == 0
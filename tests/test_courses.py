@@ -0,0 +1,55 @@
+from .conftest import create_course, create_lesson, create_topics
+
+
+def get_courses_queries(client, queries):
+    # Warm the user cache, the dashboard itself is what gets counted
+    assert client.get("/api/courses/").status_code == 200
+    queries.clear()
+
+    response = client.get("/api/courses/")
+    assert response.status_code == 200
+    return response.json(), len(queries)
+
+
+def test_get_courses_query_count_is_constant(authorized_client, session, test_user, queries):
+    course = create_course(session, test_user, "First")
+    create_topics(session, create_lesson(session, course), 3, completed=True)
+
+    courses, one_course_queries = get_courses_queries(
+        authorized_client, queries)
+    assert len(courses) == 1
+
+    for number in range(9):
+        course = create_course(session, test_user, f"Course {number}")
+        for lesson_number in range(3):
+            create_topics(session, create_lesson(
+                session, course, f"Lesson {lesson_number}"), 4, completed=lesson_number == 0)
+
+    courses, ten_course_queries = get_courses_queries(
+        authorized_client, queries)
+    assert len(courses) == 10
+
+    # SET TRANSACTION READ ONLY, the courses and one aggregate over the topics
+    assert one_course_queries == ten_course_queries == 3
+
+
+def test_get_courses_metrics(authorized_client, session, test_user):
+    course = create_course(session, test_user)
+    lesson = create_lesson(session, course)
+    create_topics(session, lesson, 3, completed=True, stability=60)
+    create_topics(session, lesson, 1)
+
+    response = authorized_client.get("/api/courses/")
+    assert response.status_code == 200
+
+    course, = response.json()
+    assert course["progress"] == 75
+    assert course["stability"] == 60
+
+
+def test_get_courses_only_lists_own_courses(authorized_client, session, test_user, other_user):
+    create_course(session, test_user, "Mine")
+    create_course(session, other_user, "Theirs")
+
+    response = authorized_client.get("/api/courses/")
+    assert [course["name"] for course in response.json()] == ["Mine"]
@@ -0,0 +1,39 @@
+import json
+import logging
+
+from .conftest import create_course, create_user
+
+
+def logged_requests(caplog, path: str):
+    return [json.loads(record.getMessage()) for record in caplog.records
+            if record.name == "app.requests" and json.loads(record.getMessage())["path"] == path]
+
+
+# Every statement of the request counts, the read-only transaction included
+def test_server_timing_counts_every_statement(authorized_client, session, test_user, queries):
+    create_course(session, test_user)
+    assert authorized_client.get("/api/courses/").status_code == 200
+    queries.clear()
+
+    response = authorized_client.get("/api/courses/")
+    assert response.status_code == 200
+    assert f'desc="{len(queries)} queries"' in response.headers["Server-Timing"]
+    assert len(queries) == 3
+
+
+# Streamed rows are read after the headers went out, the log line has them
+def test_streamed_statements_are_logged(authorized_client, session, test_user, queries, caplog):
+    test_user.superuser = True
+    session.commit()
+    for number in range(3):
+        create_user(session, f"learner{number}")
+    assert authorized_client.get("/api/users/all").status_code == 200
+    queries.clear()
+
+    with caplog.at_level(logging.INFO, logger="app.requests"):
+        response = authorized_client.get(
+            "/api/users/all", params={"format": "ndjson"})
+    assert len(response.text.splitlines()) == 4
+
+    record, = logged_requests(caplog, "/api/users/all")
+    assert record["sql_count"] == len(queries) == 2
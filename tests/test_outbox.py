@@ -0,0 +1,111 @@
+import asyncio
+import socket
+from datetime import datetime
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from app import models, outbox
+from app.config import mail
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+# Local SMTP stand-in that records connections and messages
+class Recorder:
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+        self.drop_after = None
+        self.delay = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.drop_after != None and len(self.messages) >= self.drop_after:
+            server.transport.close()
+            return "421 Closing connection"
+        await asyncio.sleep(self.delay)
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    recorder = Recorder()
+    controller = Controller(recorder, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setattr(mail, "mail_server", "127.0.0.1")
+    monkeypatch.setattr(mail, "mail_port", controller.port)
+    monkeypatch.setattr(mail, "mail_tls", False)
+    monkeypatch.setattr(mail, "mail_ssl", False)
+    monkeypatch.setattr(mail, "use_credentials", False)
+    yield recorder
+    controller.stop()
+
+
+def enqueue_emails(db, count: int):
+    emails = [outbox.enqueue(db, "Password Reset Initiated", [f"learner{number}@kengram.com"],
+                             "password_reset.html", {"code": number}) for number in range(count)]
+    db.commit()
+    return [email.id for email in emails]
+
+
+def stored_emails(db, ids):
+    db.expire_all()
+    return [db.get(models.OutboxEmail, id) for id in ids]
+
+
+def test_drain_sends_a_batch_over_one_connection(session, smtp_server):
+    ids = enqueue_emails(session, 3)
+
+    assert asyncio.run(outbox.drain()) == 3
+    assert smtp_server.connections == 1
+    assert [message.rcpt_tos for message in smtp_server.messages] == [
+        ["learner0@kengram.com"], ["learner1@kengram.com"], ["learner2@kengram.com"]]
+    assert all(email.sent_date != None for email in stored_emails(session, ids))
+
+
+# Nothing was handed to the server, so no attempt is used up
+def test_drain_releases_the_batch_when_the_server_is_down(session, smtp_server, monkeypatch):
+    monkeypatch.setattr(mail, "mail_port", free_port())
+    ids = enqueue_emails(session, 2)
+
+    assert asyncio.run(outbox.drain()) == 2
+    for email in stored_emails(session, ids):
+        assert email.sent_date == None and email.attempts == 0
+        assert email.last_error != None
+        assert email.next_attempt_date > datetime.now().astimezone()
+
+
+def test_drain_stops_when_the_connection_drops(session, smtp_server):
+    smtp_server.drop_after = 1
+    ids = enqueue_emails(session, 3)
+
+    asyncio.run(outbox.drain())
+    assert smtp_server.connections == 1
+    sent, dropped, unsent = stored_emails(session, ids)
+    assert sent.sent_date != None
+    assert dropped.sent_date == None and dropped.attempts == 1
+    assert unsent.sent_date == None and unsent.attempts == 0
+    assert unsent.next_attempt_date > datetime.now().astimezone()
+
+
+# A slow server cannot keep the batch past its lease
+def test_drain_stops_at_the_batch_timeout(session, smtp_server, monkeypatch):
+    monkeypatch.setattr(mail, "outbox_batch_timeout", 0.2)
+    smtp_server.delay = 0.5
+    ids = enqueue_emails(session, 3)
+
+    asyncio.run(outbox.drain())
+    assert len(smtp_server.messages) == 1
+    assert [email.sent_date != None for email in stored_emails(session, ids)] == [
+        True, False, False]
+    assert [email.attempts for email in stored_emails(session, ids)] == [0, 0, 0]
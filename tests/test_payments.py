@@ -0,0 +1,109 @@
+import hashlib
+import hmac
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import text
+
+from app import database, models
+from app.config import payment_settings
+
+
+def webhook(client, event: str, event_id: str, order_id: str, email: str):
+    body = json.dumps({"event": event, "payload": {"payment": {"entity": {
+        "id": "pay_1", "order_id": order_id, "email": email, "contact": "9999999999"}}}})
+    signature = hmac.new(payment_settings.razorpay_webhook_secret.encode(),
+                         body.encode(), hashlib.sha256).hexdigest()
+    return client.post("/api/users/verification", data=body, headers={
+        "Content-Type": "application/json", "X-Razorpay-Signature": signature, "X-Razorpay-Event-Id": event_id})
+
+
+@pytest.fixture
+def order(session):
+    def create(renewal: bool):
+        new_order = models.Order(id="order_1", amount=99900,
+                                 currency="INR", renewal=renewal)
+        session.add(new_order)
+        session.commit()
+        return new_order
+    return create
+
+
+# Razorpay sends payment.captured and order.paid for one payment
+def test_verify_grants_an_order_once(client, session, order):
+    order(False)
+
+    response = webhook(client, "payment.captured", "event_1",
+                       "order_1", "new@kengram.com")
+    assert response.json()["message"].startswith("Welcome package")
+
+    response = webhook(client, "order.paid", "event_2",
+                       "order_1", "new@kengram.com")
+    assert response.status_code == 200
+    assert response.json()["message"].startswith("Order already paid")
+
+    assert session.query(models.Invite).count() == 1
+    assert session.query(models.OutboxEmail).count() == 1
+    session.expire_all()
+    assert session.get(models.Order, "order_1").status == "paid"
+
+
+def test_verify_renews_for_a_renewal_order(client, session, order, test_user):
+    session.add(models.Invite(invite_code="test", phone="9999999999",
+                              email=test_user.email, event_id="event_0", user_id=test_user.id))
+    test_user.active = False
+    session.commit()
+    order(True)
+
+    response = webhook(client, "payment.captured",
+                       "event_1", "order_1", test_user.email)
+    assert response.json()["message"].startswith("Membership renewed")
+
+    session.expire_all()
+    assert session.get(models.User, test_user.id).active == True
+    assert session.query(models.Invite).count() == 1
+
+
+# The order, not the payer's email, decides between renewal and invite
+def test_verify_invites_for_a_new_membership_order(client, session, order, test_user):
+    order(False)
+
+    response = webhook(client, "payment.captured",
+                       "event_1", "order_1", test_user.email)
+    assert response.json()["message"].startswith("Welcome package")
+    assert session.query(models.Invite).count() == 1
+
+
+# Both deliveries load the order before either of them holds its lock
+def test_verify_grants_an_order_once_for_concurrent_webhooks(client, session, order):
+    order(False)
+    blocker = database.SessionLocal()
+    blocker.query(models.Order).filter(
+        models.Order.id == "order_1").with_for_update().one()
+
+    executor = ThreadPoolExecutor(2)
+    try:
+        responses = [executor.submit(webhook, client, event, event_id, "order_1", "new@kengram.com")
+                     for event, event_id in (("payment.captured", "event_1"), ("order.paid", "event_2"))]
+
+        # Release the row once both deliveries wait for it
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and session.execute(text(
+                "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock' "
+                "AND datname = current_database()")).scalar() < 2:
+            session.rollback()
+            time.sleep(0.05)
+    finally:
+        blocker.commit()
+        blocker.close()
+        executor.shutdown(wait=False)
+
+    messages = sorted(response.result(timeout=30).json()["message"]
+                      for response in responses)
+
+    assert messages[0].startswith("Order already paid")
+    assert messages[1].startswith("Welcome package")
+    session.rollback()
+    assert session.query(models.Invite).count() == 1
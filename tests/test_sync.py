@@ -0,0 +1,73 @@
+import pytest
+
+from app import metrics
+
+from .conftest import create_course, create_lesson, create_topics
+
+
+def test_sync_without_a_cursor_sends_everything(authorized_client, session, test_user):
+    create_course(session, test_user)
+
+    response = authorized_client.get("/api/sync")
+    assert response.status_code == 200
+    changes = response.json()
+    assert [course["name"] for course in changes["courses"]] == ["Course"]
+    assert changes["deleted"] == []
+
+    # Rows changed within the cursor overlap are sent again
+    response = authorized_client.get("/api/sync", params={"since": changes["cursor"]})
+    assert response.status_code == 200
+    assert [course["name"] for course in response.json()["courses"]] == ["Course"]
+
+
+# Out of range cursors overflow timedelta or datetime instead of int()
+@pytest.mark.parametrize("since", ["soon", "99999999999999999999", "-99999999999999999"])
+def test_sync_rejects_an_invalid_cursor(authorized_client, since):
+    response = authorized_client.get("/api/sync", params={"since": since})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor."
+
+
+# Two lessons of one course, each with two topics and a burst. Returns the
+# course id and the rows of each lesson, the lesson included.
+@pytest.fixture
+def course_rows(session, test_user):
+    course = create_course(session, test_user)
+    lessons = {}
+    for name in ("First", "Second"):
+        lesson = create_lesson(session, course, name)
+        topics = create_topics(session, lesson, 2)
+        burst = metrics.insert_burst(session, {
+            "course_id": course.id, "lesson_id": lesson.id, "user_id": test_user.id, "duration": 600,
+            "interrupted": False, "idempotency_key": name})
+        session.commit()
+        lessons[lesson.id] = {("lessons", lesson.id), ("bursts", burst["id"]),
+                              *(("topics", topic.id) for topic in topics)}
+    return course.id, lessons
+
+
+def deleted_since(client, cursor: str):
+    response = client.get("/api/sync", params={"since": cursor})
+    assert response.status_code == 200
+    return [(row["table"], row["id"]) for row in response.json()["deleted"]]
+
+
+# Children removed by the cascade are deleted on the client too
+def test_sync_sends_the_tombstones_of_a_deleted_course(authorized_client, course_rows):
+    course_id, lessons = course_rows
+    cursor = authorized_client.get("/api/sync").json()["cursor"]
+
+    assert authorized_client.delete(f"/api/courses/{course_id}").status_code == 200
+    deleted = deleted_since(authorized_client, cursor)
+    assert len(deleted) == 9
+    assert set(deleted) == {("courses", course_id), *lessons[min(lessons)], *lessons[max(lessons)]}
+
+
+def test_sync_sends_the_tombstones_of_a_deleted_lesson(authorized_client, course_rows):
+    course_id, lessons = course_rows
+    cursor = authorized_client.get("/api/sync").json()["cursor"]
+
+    assert authorized_client.delete(f"/api/lessons/{min(lessons)}").status_code == 200
+    deleted = deleted_since(authorized_client, cursor)
+    assert len(deleted) == 4
+    assert set(deleted) == lessons[min(lessons)]
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from .conftest import create_course, create_lesson, create_topics
+
+
+def topic_update(topic, **values):
+    return {"id": topic.id, "name": topic.name, "kengram": None, "completed": False, "revised": False,
+            "revision_count": 0, "revision_date": None, "stability": 0, **values}
+
+
+def test_create_topics(authorized_client, session, test_user):
+    lesson = create_lesson(session, create_course(session, test_user))
+
+    response = authorized_client.post("/api/topics/bulk", json=[
+        {"name": f"Topic {number}", "lesson_id": lesson.id, "course_id": lesson.course_id} for number in range(3)])
+    assert response.status_code == 201
+
+    topics = response.json()
+    assert [topic["name"] for topic in topics] == [
+        "Topic 0", "Topic 1", "Topic 2"]
+    assert all(topic["user_id"] == test_user.id for topic in topics)
+
+
+def test_create_topics_rejects_the_batch_for_a_foreign_lesson(authorized_client, session, test_user, other_user):
+    lesson = create_lesson(session, create_course(session, test_user))
+    foreign_lesson = create_lesson(session, create_course(session, other_user))
+
+    response = authorized_client.post("/api/topics/bulk", json=[
+        {"name": "Mine", "lesson_id": lesson.id, "course_id": lesson.course_id},
+        {"name": "Theirs", "lesson_id": foreign_lesson.id, "course_id": foreign_lesson.course_id}])
+    assert response.status_code == 403
+
+
+def test_update_topics(authorized_client, session, test_user):
+    lesson = create_lesson(session, create_course(
+        session, test_user, intensity="High"))
+    completed, renamed, noted = create_topics(session, lesson, 3)
+
+    response = authorized_client.patch("/api/topics/bulk", json=[
+        topic_update(completed, completed=True),
+        topic_update(renamed, name="Renamed"),
+        topic_update(noted, kengram="Note", revision_date="2026-01-01T00:00:00+00:00")])
+    assert response.status_code == 200
+
+    topics = {topic["id"]: topic for topic in response.json()}
+    assert topics[completed.id]["completed"] == True
+    assert topics[completed.id]["stability"] == 20
+    assert datetime.fromisoformat(
+        topics[completed.id]["revision_date"]) > datetime.now().astimezone()
+    assert topics[renamed.id]["name"] == "Renamed"
+    assert topics[renamed.id]["revision_date"] == None
+    assert topics[noted.id]["kengram"] == "Note"
+    assert datetime.fromisoformat(
+        topics[noted.id]["revision_date"]).year == 2026
+
+
+# A revision builds on the stability the topic has, like PUT /api/topics/
+def test_update_topics_increases_stored_stability(authorized_client, session, test_user):
+    lesson = create_lesson(session, create_course(session, test_user))
+    topic, single_topic = create_topics(
+        session, lesson, 2, completed=True, revision_count=2, stability=50)
+
+    response = authorized_client.patch("/api/topics/bulk", json=[topic_update(
+        topic, completed=True, revised=True, revision_count=3, stability=50)])
+    assert response.status_code == 200
+    assert response.json()[0]["stability"] == 70
+
+    response = authorized_client.put("/api/topics/", json=topic_update(
+        single_topic, completed=True, revised=True, revision_count=3, stability=50))
+    assert response.status_code == 200
+    assert response.json()["stability"] == 70
+
+
+# Every kengram and revision date of the batch is NULL
+def test_update_topics_with_null_columns(authorized_client, session, test_user):
+    topics = create_topics(session, create_lesson(
+        session, create_course(session, test_user)), 2)
+
+    response = authorized_client.patch("/api/topics/bulk", json=[
+        topic_update(topic, name=f"Renamed {topic.id}") for topic in topics])
+    assert response.status_code == 200
+    assert all(topic["name"] == f"Renamed {topic['id']}" and topic["revision_date"] == None
+               for topic in response.json())
+
+
+def test_update_topics_rejects_the_batch_for_a_foreign_topic(authorized_client, session, test_user, other_user):
+    topic, = create_topics(session, create_lesson(
+        session, create_course(session, test_user)), 1)
+    foreign_topic, = create_topics(session, create_lesson(
+        session, create_course(session, other_user)), 1)
+
+    response = authorized_client.patch("/api/topics/bulk", json=[
+        topic_update(topic, name="Mine"), topic_update(foreign_topic, name="Theirs")])
+    assert response.status_code == 403
+
+    session.expire_all()
+    assert session.get(type(topic), topic.id).name == "Topic 0"
+
+
+def test_get_due_topics_pages_with_a_cursor(authorized_client, session, test_user):
+    topics = create_topics(session, create_lesson(session, create_course(session, test_user)), 3,
+                           completed=True, revised=False, revision_date=datetime.now().astimezone() - timedelta(days=1))
+
+    response = authorized_client.get("/api/topics/due", params={"limit": 2})
+    assert response.status_code == 200
+    page = response.json()
+    assert [topic["id"] for topic in page["topics"]] == [topic.id for topic in topics[:2]]
+
+    response = authorized_client.get("/api/topics/due", params={"limit": 2, "cursor": page["next_cursor"]})
+    assert [topic["id"] for topic in response.json()["topics"]] == [topics[2].id]
+    assert response.json()["next_cursor"] == None
+
+
+# Out of range cursors overflow timedelta or datetime instead of int()
+@pytest.mark.parametrize("cursor", ["soon", "1_2_3", "99999999999999999999_1", "-99999999999999999_1"])
+def test_get_due_topics_rejects_an_invalid_cursor(authorized_client, cursor):
+    response = authorized_client.get("/api/topics/due", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor."
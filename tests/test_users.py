@@ -0,0 +1,134 @@
+import pytest
+from sqlalchemy import text
+
+from app import hashing, models, oauth2, utils
+
+from .conftest import create_user
+
+
+@pytest.fixture
+def superuser_client(client, session, test_user):
+    test_user.superuser = True
+    session.commit()
+    token = oauth2.create_access_token(data={"id": test_user.id})
+    client.headers = {**client.headers, "Authorization": f"Bearer {token}",
+                      "Origin": "https://kengram.com"}
+    return client
+
+
+# Connections the request holds while its password is hashed or verified
+@pytest.fixture
+def held_while_hashing(connections, monkeypatch):
+    held = []
+    hash, verify = hashing.hash, hashing.verify
+
+    async def probed_hash(password):
+        held.append(connections["open"])
+        return await hash(password)
+
+    async def probed_verify(plain, hashed):
+        held.append(connections["open"])
+        return await verify(plain, hashed)
+
+    monkeypatch.setattr(hashing, "hash", probed_hash)
+    monkeypatch.setattr(hashing, "verify", probed_verify)
+    return held
+
+
+@pytest.fixture
+def invite(session):
+    invite = models.Invite(invite_code="invite", phone="9999999999",
+                           email="new@kengram.com", event_id="event_1")
+    session.add(invite)
+    session.commit()
+    return invite
+
+
+def new_user(invite_code: str = "invite"):
+    return {"name": "New", "username": "new", "email": "new@kengram.com",
+            "password": "password1", "invite_code": invite_code}
+
+
+def test_login_verifies_without_a_connection(client, session, test_user, held_while_hashing, connections):
+    test_user.password = utils.hash("password1")
+    session.commit()
+    before = connections["open"]
+
+    response = client.post(
+        "/api/login", data={"username": "test", "password": "password1"})
+    assert response.status_code == 200
+    assert held_while_hashing == [before]
+
+
+def test_create_user_hashes_without_a_connection(client, session, invite, held_while_hashing, connections):
+    before = connections["open"]
+
+    response = client.post("/api/users/", json=new_user())
+    assert response.status_code == 201
+    assert held_while_hashing == [before]
+
+    session.refresh(invite)
+    assert invite.user_id == session.query(models.User).filter(
+        models.User.username == "new").one().id
+
+
+# Another sign-up takes the invite while this one hashes its password
+def test_create_user_checks_the_invite_again_after_hashing(client, session, invite, other_user, monkeypatch):
+    hash = hashing.hash
+
+    async def hash_while_invite_is_taken(password):
+        # Fails instead of waiting on a sign-up that still holds the invite
+        session.execute(text("SET LOCAL lock_timeout = '5s'"))
+        invite.user_id = other_user.id
+        session.commit()
+        return await hash(password)
+
+    monkeypatch.setattr(hashing, "hash", hash_while_invite_is_taken)
+
+    response = client.post("/api/users/", json=new_user())
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Wrong invite code."
+    assert session.query(models.User).filter(
+        models.User.username == "new").first() == None
+
+
+def test_reset_password_hashes_without_a_connection(client, session, test_user, held_while_hashing, connections):
+    test_user.reset_code = "123456"
+    session.commit()
+    reset = {"email_address": test_user.email,
+             "reset_code": "123456", "new_password": "password2"}
+    before = connections["open"]
+
+    response = client.post("/api/users/reset-password", json=reset)
+    assert response.status_code == 200
+    assert held_while_hashing == [before]
+
+    session.refresh(test_user)
+    assert utils.verify("password2", test_user.password)
+
+
+def test_get_all_users_pages_with_a_readable_cursor(superuser_client, session):
+    for number in range(2):
+        create_user(session, f"learner{number}")
+
+    response = superuser_client.get("/api/users/all", params={"limit": 2})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+    # Browsers only hand the cursor to the admin client if CORS exposes it
+    assert response.headers["Access-Control-Allow-Origin"] == "https://kengram.com"
+    assert "X-Next-Cursor" in response.headers["Access-Control-Expose-Headers"]
+
+    response = superuser_client.get("/api/users/all", params={
+        "limit": 2, "after_id": response.headers["X-Next-Cursor"]})
+    assert [user["username"] for user in response.json()] == ["learner1"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_all_users_streams_ndjson(superuser_client, session):
+    for number in range(3):
+        create_user(session, f"learner{number}")
+
+    response = superuser_client.get("/api/users/all", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 4
@@ -0,0 +1,140 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from hypothesis import given, strategies as st
+
+from app import utils, vectorized
+
+
+# utils reads the clock, vectorized is given it. Both see the same now.
+now = 1790000000
+year_in_seconds = 31536000
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fromtimestamp(now, tz)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def frozen_clock():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(utils, "datetime", FrozenDatetime)
+        yield
+
+
+def as_date(timestamp: int):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+timestamps = st.integers(now - 5 * year_in_seconds, now + 5 * year_in_seconds)
+stabilities = st.integers(0, 100)
+revision_counts = st.integers(0, 50)
+intensity_names = st.sampled_from(["Low", "Medium", "High"])
+
+
+@given(st.lists(stabilities))
+def test_increased_stability(stability_list):
+    assert vectorized.increased_stability(stability_list).tolist() == [
+        utils.increase_topic_stability(stability) for stability in stability_list]
+
+
+@given(st.lists(st.tuples(stabilities, revision_counts, timestamps)))
+def test_decreased_stability(topics):
+    stability_list, revision_count_list, revision_date_list = zip(
+        *topics) if topics else ((), (), ())
+    assert vectorized.decreased_stability(stability_list, revision_count_list, revision_date_list, now).tolist() == [
+        utils.decrease_topic_stability(stability, revision_count, as_date(revision_date))
+        for stability, revision_count, revision_date in topics]
+
+
+@given(st.lists(st.tuples(revision_counts, intensity_names)))
+def test_revision_dates(topics):
+    revision_count_list, intensity_list = zip(*topics) if topics else ((), ())
+    assert vectorized.revision_dates(revision_count_list, intensity_list, now).tolist() == [
+        utils.calculate_revision_date(revision_count, intensity).timestamp()
+        for revision_count, intensity in topics]
+
+
+@given(st.lists(timestamps))
+def test_revision_due_and_overdue(dates):
+    assert vectorized.revision_due(dates, now).tolist() == [
+        utils.revision_due(as_date(date)) for date in dates]
+    assert vectorized.revision_overdue(dates, now).tolist() == [
+        utils.revision_overdue(as_date(date)) for date in dates]
+
+
+@given(st.lists(st.one_of(st.none(), timestamps)))
+def test_streak_lapsed(last_burst_dates):
+    assert vectorized.streak_lapsed([np.nan if date == None else date for date in last_burst_dates], now).tolist() == [
+        utils.check_streak_lapsed(None if date == None else as_date(date)) for date in last_burst_dates]
+
+
+@given(st.lists(st.integers(0, 10 ** 9)))
+def test_strength(durations):
+    assert vectorized.strength(durations).tolist() == [
+        utils.calculate_strength(duration) for duration in durations]
+
+
+@given(st.lists(st.integers(0, 10 ** 6).flatmap(
+    lambda count: st.tuples(st.integers(0, count), st.just(count)))))
+def test_progress_and_average_stability(units):
+    completed_counts, unit_counts = zip(*units) if units else ((), ())
+    assert vectorized.progress(completed_counts, unit_counts).tolist() == [
+        utils.calculate_progress(completed, count) for completed, count in units]
+
+    stability_sums = [completed * 73 for completed in completed_counts]
+    assert vectorized.average_stability(stability_sums, unit_counts).tolist() == [
+        utils.calculate_average_stability(stability_sum, count)
+        for stability_sum, count in zip(stability_sums, unit_counts)]
+
+
+@given(st.lists(st.tuples(timestamps, st.integers(0, 100))))
+def test_velocities(courses):
+    dates, progresses = zip(*courses) if courses else ((), ())
+    assert vectorized.current_velocity(dates, progresses, now).tolist() == [
+        utils.calculate_current_velocity(as_date(date), progress) for date, progress in courses]
+    assert vectorized.required_velocity(dates, progresses, now).tolist() == [
+        utils.calculate_required_velocity(as_date(date), progress) for date, progress in courses]
+
+
+@given(st.lists(st.tuples(timestamps, st.integers(1, 5000)), min_size=1).flatmap(
+    lambda courses: st.tuples(st.just(courses), st.lists(st.tuples(
+        st.integers(0, len(courses) - 1), timestamps, st.integers(0, 36000))))))
+def test_goal_status(cohort):
+    courses, bursts = cohort
+    burst_course_index = np.array([burst[0] for burst in bursts], dtype=np.int64)
+    goal_statuses = vectorized.goal_status(
+        burst_course_index, [burst[1] for burst in bursts], [burst[2] for burst in bursts],
+        [course[0] for course in courses], [course[1] for course in courses])
+
+    assert goal_statuses.tolist() == [utils.calculate_goal_status(
+        [SimpleNamespace(creation_date=as_date(date), duration=duration)
+         for index, date, duration in bursts if index == course_index],
+        SimpleNamespace(goal_reset_date=as_date(goal_reset_date), goal=goal))
+        for course_index, (goal_reset_date, goal) in enumerate(courses)]
+
+
+@given(st.integers(1, 5).flatmap(lambda user_count: st.tuples(st.just(user_count), st.lists(st.tuples(
+    st.integers(0, user_count - 1), st.integers(1, 5000), st.floats(0, 300),
+    st.integers(0, 10 ** 6), st.integers(0, 100))))))
+def test_user_metrics(cohort):
+    user_count, courses = cohort
+    course_user_index = np.array([course[0] for course in courses], dtype=np.int64)
+    goals, goal_statuses, strengths, progresses = (
+        [course[column] for course in courses] for column in range(1, 5))
+
+    user_courses = [[SimpleNamespace(goal=goal, goal_status=goal_status, strength=strength, progress=progress)
+                     for user_index, goal, goal_status, strength, progress in courses if user_index == user]
+                    for user in range(user_count)]
+    assert vectorized.user_goal_status(course_user_index, goals, goal_statuses, user_count).tolist() == [
+        utils.calculate_user_goal_status(courses) for courses in user_courses]
+    assert vectorized.user_strength(course_user_index, strengths, user_count).tolist() == [
+        utils.calculate_user_strength(courses) for courses in user_courses]
+    assert vectorized.user_level(course_user_index, strengths, user_count).tolist() == [
+        utils.calculate_user_level(courses) for courses in user_courses]
+    assert vectorized.user_progress(course_user_index, progresses, user_count).tolist() == [
+        utils.calculate_user_progress(courses) for courses in user_courses]
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import models, writebehind
+from app.config import settings
+
+from .conftest import create_course, create_lesson
+
+
+@pytest.fixture
+def write_behind(session, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "burst_write_behind", True)
+    monkeypatch.setattr(settings, "burst_spool_dir", str(tmp_path))
+    writebehind.start()
+    yield tmp_path
+    if writebehind.spool != None:
+        writebehind.spool.close()
+        writebehind.spool = None
+    if writebehind.lock_file != None:
+        writebehind.lock_file.close()
+        writebehind.lock_file = None
+    writebehind.pending = 0
+
+
+def burst_values(lesson, number: int):
+    return {"course_id": lesson.course_id, "lesson_id": lesson.id, "duration": 60, "interrupted": False,
+            "interruption": None, "user_id": lesson.user_id, "idempotency_key": f"key-{number}",
+            "creation_date": "2026-10-16T10:00:00+00:00"}
+
+
+def test_create_burst_is_spooled_and_flushed(write_behind, authorized_client, session, test_user):
+    lesson = create_lesson(session, create_course(session, test_user))
+
+    for _ in range(3):
+        response = authorized_client.post("/api/bursts/", json={
+            "course_id": lesson.course_id, "lesson_id": lesson.id, "duration": 300, "interrupted": False})
+        assert response.status_code == 202
+        assert response.json()["id"] == None
+
+    assert session.query(models.Burst).count() == 0
+    assert writebehind.flush() == 3
+
+    session.expire_all()
+    assert session.query(models.Burst).count() == 3
+    assert session.get(models.Course, lesson.course_id).total_duration == 900
+
+
+def test_create_burst_checks_the_lesson(write_behind, authorized_client, session, test_user, other_user):
+    foreign_lesson = create_lesson(session, create_course(session, other_user))
+
+    response = authorized_client.post("/api/bursts/", json={
+        "course_id": foreign_lesson.course_id, "lesson_id": foreign_lesson.id, "duration": 300, "interrupted": False})
+    assert response.status_code == 403
+    assert writebehind.pending == 0
+
+
+# Concurrent appends share one fsync, run off the event loop thread
+def test_enqueue_groups_fsyncs(write_behind, session, test_user, monkeypatch):
+    lesson = create_lesson(session, create_course(session, test_user))
+    fsync_threads = []
+    monkeypatch.setattr(writebehind.os, "fsync",
+                        lambda fd: fsync_threads.append(threading.get_ident()))
+
+    async def enqueue_all():
+        return await asyncio.gather(*[writebehind.enqueue(burst_values(lesson, number)) for number in range(20)])
+
+    assert all(asyncio.run(enqueue_all()))
+    assert len(fsync_threads) == 1
+    assert fsync_threads[0] != threading.get_ident()
+    assert writebehind.pending == 20
+
+
+# stop() waits for the flush the worker is running before its final drain
+def test_stop_does_not_overlap_a_running_flush(write_behind, session, test_user, monkeypatch):
+    lesson = create_lesson(session, create_course(session, test_user))
+    monkeypatch.setattr(settings, "burst_flush_interval", 10)
+
+    running = []
+    overlapped = []
+    insert_spool = writebehind.insert_spool
+
+    def slow_insert_spool(path):
+        running.append(path)
+        overlapped.append(len(running) > 1)
+        time.sleep(0.2)
+        try:
+            return insert_spool(path)
+        finally:
+            running.remove(path)
+
+    monkeypatch.setattr(writebehind, "insert_spool", slow_insert_spool)
+
+    async def run():
+        for number in range(3):
+            await writebehind.enqueue(burst_values(lesson, number))
+        worker = asyncio.create_task(writebehind.run_worker())
+        await asyncio.sleep(0.1)
+        await writebehind.enqueue(burst_values(lesson, 3))
+        await writebehind.stop(worker)
+
+    asyncio.run(run())
+    assert overlapped == [False, False]
+    assert session.query(models.Burst).count() == 4
+    assert list(write_behind.iterdir()) == []
+
+
+def test_flush_logs_bursts_of_deleted_lessons(write_behind, session, test_user, caplog):
+    course = create_course(session, test_user)
+    lesson = create_lesson(session, course)
+    deleted_lesson = create_lesson(session, course, "Deleted")
+
+    async def enqueue_both():
+        await writebehind.enqueue(burst_values(lesson, 0))
+        await writebehind.enqueue(burst_values(deleted_lesson, 1))
+
+    asyncio.run(enqueue_both())
+    session.delete(deleted_lesson)
+    session.commit()
+
+    assert writebehind.flush() == 1
+    assert session.query(models.Burst).count() == 1
+    assert "Dropped 1 bursts" in caplog.text and "key-1" in caplog.text
+
+
+# A batch the database rejects is set aside and newer bursts go through
+def test_flush_dead_letters_a_failing_batch(write_behind, session, test_user, monkeypatch):
+    monkeypatch.setattr(settings, "burst_flush_max_attempts", 3)
+    lesson = create_lesson(session, create_course(session, test_user))
+    asyncio.run(writebehind.enqueue(
+        dict(burst_values(lesson, 0), duration=2 ** 40)))
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            writebehind.flush()
+    assert writebehind.flush() == 0
+
+    dead, = write_behind.glob("*.dead")
+    assert b"key-0" in dead.read_bytes()
+
+    asyncio.run(writebehind.enqueue(burst_values(lesson, 1)))
+    assert writebehind.flush() == 1
+
+
+# An unreachable database is waited out, however long it takes
+def test_flush_retries_while_the_database_is_unreachable(write_behind, session, test_user, monkeypatch):
+    monkeypatch.setattr(settings, "burst_flush_max_attempts", 2)
+    lesson = create_lesson(session, create_course(session, test_user))
+    asyncio.run(writebehind.enqueue(burst_values(lesson, 0)))
+
+    def unreachable(path):
+        raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+    insert_spool = writebehind.insert_spool
+    monkeypatch.setattr(writebehind, "insert_spool", unreachable)
+    for _ in range(5):
+        with pytest.raises(OperationalError):
+            writebehind.flush()
+    assert list(write_behind.glob("*.dead")) == []
+
+    monkeypatch.setattr(writebehind, "insert_spool", insert_spool)
+    assert writebehind.flush() == 1
+
+
+def test_start_recovers_orphaned_spools(session, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "burst_spool_dir", str(tmp_path))
+    lesson = create_lesson(session, create_course(session, test_user))
+
+    # A dead worker leaves its lock file unlocked
+    lock_path, spool_path, _ = writebehind.spool_paths("bursts-1")
+    lock_path.touch()
+    spool_path.write_bytes(b"".join(writebehind.orjson.dumps(
+        burst_values(lesson, number)) + b"\n" for number in range(2)) + b'{"torn')
+
+    writebehind.start()
+    try:
+        assert not lock_path.exists() and not spool_path.exists()
+        assert session.query(models.Burst).count() == 2
+    finally:
+        writebehind.spool.close()
+        writebehind.spool = None
+        writebehind.lock_file.close()
+        writebehind.lock_file = None